@@ -0,0 +1,166 @@
+"""
+Music and sound effects, played from a thread of their own.
+
+Starting the mixer and loading a MIDI track take long enough to drop
+frames, so the game loop never touches the mixer: it queues commands and
+the audio thread carries them out. The thread starts the mixer, reads
+every track in battle/sound into memory and makes the sound effects once,
+up front, so switching tracks later only loads from memory. Each command
+is stamped when queued and the time it waited before being carried out is
+kept, for the frame stats to report.
+"""
+import array
+import io
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+SOUND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sound')
+FREQUENCY = 22050
+LINE = 'line'
+BONUS = 'bonus'
+GAME_OVER = 'game_over'
+# (frequency in Hz, seconds) of the notes of every effect
+EFFECTS = {
+    LINE: ((880, .06),),
+    BONUS: ((660, .06), (880, .06), (1320, .1)),
+    GAME_OVER: ((440, .15), (330, .15), (220, .3)),
+}
+VOLUME = .25
+CLOSE_TIMEOUT = 1.0  # seconds close waits for the thread to let go of the mixer
+
+
+def tracks(directory=SOUND_DIR):
+    """
+    Return the names of the MIDI tracks in directory, without extension.
+    """
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(directory) if name.endswith('.mid'))
+
+
+def tone(notes, frequency=FREQUENCY, channels=1, volume=VOLUME):
+    """
+    Return the signed 16 bit samples of notes, square waves of
+    (frequency in Hz, seconds), as bytes ready for pygame.mixer.Sound.
+    One period is made per note and repeated, so it takes next to no time.
+    """
+    samples = array.array('h')
+    peak = int(32767 * volume)
+    for pitch, seconds in notes:
+        count = int(frequency * seconds)
+        period = max(2, int(round(float(frequency) / pitch)))
+        wave = array.array('h', [peak] * (period // 2 * channels) + [-peak] * ((period - period // 2) * channels))
+        note = (wave * (count // period + 1))[:count * channels]
+        fade = max(1, count // 8)  # ramp the end down so it does not click
+        for i in range(count - fade, count):
+            for channel in range(channels):
+                note[i * channels + channel] = note[i * channels + channel] * (count - i) // fade
+        samples.extend(note)
+    return samples.tobytes()
+
+
+class Audio(threading.Thread):
+    """
+    The audio thread. Its methods only queue a command and return at once;
+    run carries the commands out in order. Without a sound device (or
+    without pygame.mixer) every command is dropped, so the game plays on
+    silently.
+    """
+    daemon = True
+    enabled = True  # False once the mixer failed to start
+    track = None  # name of the track playing
+
+    def __init__(self, directory=SOUND_DIR, window=100):
+        """
+        @param directory: where the MIDI tracks are
+        @param window: number of command latencies kept
+        """
+        super(Audio, self).__init__(name='audio')
+        self.directory = directory
+        self.tracks = tracks(directory)
+        self.commands = queue.Queue()
+        self.latencies = deque(maxlen=window)  # ms from queued to done, appended by the audio thread
+        self.music = dict()
+        self.effects = dict()
+
+    def play_music(self, name):
+        """
+        Switch to the track name, looping it.
+        """
+        self.commands.put((time.perf_counter(), 'switch', name))
+
+    def stop_music(self):
+        self.commands.put((time.perf_counter(), 'stop', None))
+
+    def pause_music(self):
+        self.commands.put((time.perf_counter(), 'pause', None))
+
+    def resume_music(self):
+        self.commands.put((time.perf_counter(), 'resume', None))
+
+    def play_effect(self, name):
+        """
+        Play the effect name (LINE, BONUS or GAME_OVER) over the music.
+        """
+        self.commands.put((time.perf_counter(), 'effect', name))
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Stop the thread, after what is already queued, and wait for it to
+        shut the mixer down.
+        """
+        self.commands.put((time.perf_counter(), 'close', None))
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def preload(self):
+        """
+        Start the mixer, read every track and make every effect. Run on the
+        audio thread before the first command.
+        """
+        import pygame
+        try:
+            pygame.mixer.init(FREQUENCY, -16)
+        except pygame.error:
+            self.enabled = False
+            return
+        frequency, _, channels = pygame.mixer.get_init()
+        for name in self.tracks:
+            with open(os.path.join(self.directory, name + '.mid'), 'rb') as f:
+                self.music[name] = f.read()
+        for name, notes in EFFECTS.items():
+            self.effects[name] = pygame.mixer.Sound(buffer=tone(notes, frequency, channels))
+
+    def run(self):
+        self.preload()
+        while True:
+            queued, command, name = self.commands.get()
+            if command == 'close':
+                if self.enabled:
+                    import pygame
+                    pygame.mixer.quit()
+                return
+            if self.enabled:
+                self.execute(command, name)
+            self.latencies.append((time.perf_counter() - queued) * 1000)
+
+    def execute(self, command, name):
+        import pygame
+        music = pygame.mixer.music
+        try:
+            if command == 'switch':
+                music.load(io.BytesIO(self.music[name]), name + '.mid')
+                music.play(-1, 0.0)
+                self.track = name
+            elif command == 'stop':
+                music.stop()
+                self.track = None
+            elif command == 'pause':
+                music.pause()
+            elif command == 'resume':
+                music.unpause()
+            elif command == 'effect':
+                self.effects[name].play()
+        except (pygame.error, KeyError):
+            pass  # e.g. no MIDI synth for the track, keep going without it
@@ -0,0 +1,218 @@
+import numpy
+from battle import COLORS
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, TEMPLATE_WIDTH, POISON_RATE
+from battle.engine import MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN, ROTATE, ROTATE_BACK, DROP
+from battle.shapes import COMPILED_SHAPES
+from battle.templates import SHAPES, POISONS
+
+NOTHING = -1
+POISON_BOX = 255  # board value of a poison box
+# The plain shapes come first, then the poison ones
+SHAPE_NAMES = tuple(sorted(SHAPES)) + tuple(sorted(POISONS))
+PLAIN_SHAPES = len(SHAPES)
+ROTATIONS = numpy.array([len(COMPILED_SHAPES[name]) for name in SHAPE_NAMES])
+MAX_ROTATIONS = int(ROTATIONS.max())
+CELL_COUNT = max(len(shape.cells + shape.poison_cells) for name in SHAPE_NAMES for shape in COMPILED_SHAPES[name])
+
+
+def compile_cell_table():
+    """
+    Return a (shapes, MAX_ROTATIONS, CELL_COUNT, 2) array of the cell
+    offsets of every shape rotation, solid cells first and then the poison
+    ones, and a (shapes, MAX_ROTATIONS, CELL_COUNT) array that is True for
+    the poison cells. Missing rotations wrap around and shapes with fewer
+    cells repeat their first (solid) cell, which changes nothing for
+    collisions or locking.
+    """
+    table = numpy.zeros((len(SHAPE_NAMES), MAX_ROTATIONS, CELL_COUNT, 2), dtype=numpy.int64)
+    poison = numpy.zeros((len(SHAPE_NAMES), MAX_ROTATIONS, CELL_COUNT), dtype=bool)
+    for i, name in enumerate(SHAPE_NAMES):
+        rotations = COMPILED_SHAPES[name]
+        for rotation in range(MAX_ROTATIONS):
+            shape = rotations[rotation % len(rotations)]
+            cells = shape.cells + shape.poison_cells
+            table[i, rotation] = cells + shape.cells[:1] * (CELL_COUNT - len(cells))
+            poison[i, rotation, len(shape.cells):len(cells)] = True
+    return table, poison
+
+
+CELLS, POISON_CELLS = compile_cell_table()
+
+
+class BatchSimulator(object):
+    """
+    Steps N independent games in lockstep with numpy. Boards are stored as
+    an (N, BOARD_HEIGHT, BOARD_WIDTH) uint8 array holding 0 for a blank box
+    and color + 1 for a filled one, POISON_BOX for a poison one. Every game
+    takes one action per step and then the piece falls one row, landing
+    pieces lock, completed lines are removed and scored exactly like
+    Engine.remove_completed_line does, lines with poison in them staying.
+    A share poison_rate of the pieces are poison ones, as from PieceStream.
+    """
+
+    def __init__(self, n, seed=None, poison_rate=POISON_RATE):
+        self.n = n
+        self.poison_rate = poison_rate
+        self.random = numpy.random.default_rng(seed)
+        self.boards = numpy.zeros((n, BOARD_HEIGHT, BOARD_WIDTH), dtype=numpy.uint8)
+        self.piece = dict((key, numpy.zeros(n, dtype=numpy.int64)) for key in ('shape', 'rotation', 'x', 'y', 'color'))
+        self.next_piece = dict((key, numpy.zeros(n, dtype=numpy.int64)) for key in self.piece)
+        self.score = numpy.zeros(n, dtype=numpy.int64)
+        self.lines = numpy.zeros(n, dtype=numpy.int64)
+        self.bonus_lines = numpy.zeros(n, dtype=numpy.int64)
+        self.pieces = numpy.zeros(n, dtype=numpy.int64)
+        self.game_over = numpy.zeros(n, dtype=bool)
+        self.reset()
+
+    def new_pieces(self, count):
+        """
+        Return count random pieces the same way make_piece makes them.
+        """
+        shape = self.random.integers(0, PLAIN_SHAPES, count)
+        if self.poison_rate:
+            poison = self.random.random(count) < self.poison_rate
+            shape[poison] = self.random.integers(PLAIN_SHAPES, len(SHAPE_NAMES), int(poison.sum()))
+        return dict(
+            shape=shape,
+            rotation=self.random.integers(0, ROTATIONS[shape]),
+            x=self.random.integers(0, BOARD_WIDTH - TEMPLATE_WIDTH + 1, count),
+            y=numpy.full(count, -2, dtype=numpy.int64),  # start it above the board
+            color=self.random.integers(0, len(COLORS), count),
+        )
+
+    def reset(self, which=None):
+        """
+        Start new games for the selected boards (every board by default).
+
+        @param which: boolean mask or index array of the games to reset
+        """
+        if which is None:
+            which = numpy.ones(self.n, dtype=bool)
+        self.boards[which] = 0
+        for array in (self.score, self.lines, self.bonus_lines, self.pieces):
+            array[which] = 0
+        self.game_over[which] = False
+        count = len(self.score[which])
+        for key, values in self.new_pieces(count).items():
+            self.piece[key][which] = values
+        for key, values in self.new_pieces(count).items():
+            self.next_piece[key][which] = values
+
+    def cells(self, adj_x=0, adj_y=0, rotation=None):
+        """
+        Return the (N, CELL_COUNT) board x and y of the falling pieces' cells.
+        """
+        if rotation is None:
+            rotation = self.piece['rotation']
+        offsets = CELLS[self.piece['shape'], rotation]
+        xs = offsets[:, :, 0] + (self.piece['x'] + adj_x)[:, None]
+        ys = offsets[:, :, 1] + (self.piece['y'] + adj_y)[:, None]
+        return xs, ys
+
+    def is_valid_position(self, adj_x=0, adj_y=0, rotation=None):
+        """
+        Return a boolean array, True where the piece is within the board and
+        not colliding. Cells above the board are never checked.
+        """
+        xs, ys = self.cells(adj_x, adj_y, rotation)
+        on_board = (xs >= 0) & (xs < BOARD_WIDTH) & (ys < BOARD_HEIGHT)
+        games = numpy.broadcast_to(numpy.arange(self.n)[:, None], xs.shape)
+        taken = self.boards[games, numpy.clip(ys, 0, BOARD_HEIGHT - 1), numpy.clip(xs, 0, BOARD_WIDTH - 1)] != 0
+        blocked = (ys >= 0) & (~on_board | taken)
+        return ~blocked.any(axis=1)
+
+    def move(self, which, adj_x=0, adj_y=0, rotation=None):
+        """
+        Move or rotate the pieces of the selected games that have room for it.
+        """
+        if not which.any():
+            return
+        room = which & self.is_valid_position(adj_x, adj_y, rotation)
+        self.piece['x'][room] += adj_x
+        self.piece['y'][room] += adj_y
+        if rotation is not None:
+            self.piece['rotation'][room] = rotation[room]
+
+    def apply_actions(self, actions):
+        """
+        Apply one of the engine ACTIONS (or NOTHING) to every game.
+
+        @param actions: (N,) int array
+        """
+        actions = numpy.where(self.game_over, NOTHING, actions)
+        rotations = ROTATIONS[self.piece['shape']]
+        self.move(actions == MOVE_LEFT, adj_x=-1)
+        self.move(actions == MOVE_RIGHT, adj_x=1)
+        self.move(actions == MOVE_DOWN, adj_y=1)
+        self.move(actions == ROTATE, rotation=(self.piece['rotation'] + 1) % rotations)
+        self.move(actions == ROTATE_BACK, rotation=(self.piece['rotation'] - 1) % rotations)
+        dropping = actions == DROP
+        # Never more than BOARD_HEIGHT - 2 rows at once, as in Engine
+        for _ in range(BOARD_HEIGHT - 2):
+            dropping &= self.is_valid_position(adj_y=1)
+            if not dropping.any():
+                break
+            self.piece['y'][dropping] += 1
+
+    def lock(self, which):
+        """
+        Write the falling pieces of the selected games into their boards.
+        """
+        xs, ys = self.cells()
+        games = numpy.broadcast_to(numpy.arange(self.n)[:, None], xs.shape)
+        keep = which[:, None] & (ys >= 0)
+        colors = numpy.where(POISON_CELLS[self.piece['shape'], self.piece['rotation']], POISON_BOX,
+                             (self.piece['color'] + 1)[:, None])
+        self.boards[games[keep], ys[keep], xs[keep]] = colors[keep]
+
+    def remove_completed_lines(self, which):
+        """
+        Remove the complete lines of the selected games in one pass, score
+        them like Engine.remove_completed_line and return the lines removed.
+        """
+        boards = self.boards
+        complete = which[:, None] & (boards != 0).all(axis=2) & ~(boards == POISON_BOX).any(axis=2)
+        bonus = complete & (boards == boards[:, :, :1]).all(axis=2)
+        removed = complete.sum(axis=1)
+        if removed.any():
+            # Complete rows sort to the top (stable), everything else keeps its order.
+            order = numpy.argsort(~complete, axis=1, kind='stable')
+            self.boards = boards = numpy.take_along_axis(boards, order[:, :, None], axis=1)
+            boards[numpy.arange(BOARD_HEIGHT)[None, :] < removed[:, None]] = 0
+        bonus_count = bonus.sum(axis=1)
+        self.lines += removed
+        self.bonus_lines += bonus_count
+        self.score += removed + 4 * bonus_count
+        return removed
+
+    def spawn(self, which):
+        """
+        Move the next pieces of the selected games into play and end the
+        games whose new piece does not fit.
+        """
+        count = int(which.sum())
+        fresh = self.new_pieces(count)
+        for key in self.piece:
+            self.piece[key][which] = self.next_piece[key][which]
+            self.next_piece[key][which] = fresh[key]
+        self.pieces += which
+        self.game_over |= which & ~self.is_valid_position()
+
+    def step(self, actions=None):
+        """
+        Apply actions, let every piece fall one row and lock, clear and
+        respawn the pieces that landed. Return the game over array.
+
+        @param actions: (N,) int array of ACTIONS or NOTHING
+        """
+        if actions is not None:
+            self.apply_actions(numpy.asarray(actions))
+        playing = ~self.game_over
+        falls = playing & self.is_valid_position(adj_y=1)
+        self.piece['y'][falls] += 1
+        landed = playing & ~falls
+        if landed.any():
+            self.lock(landed)
+            self.remove_completed_lines(landed)
+            self.spawn(landed)
+        return self.game_over
@@ -0,0 +1,318 @@
+from collections import deque
+from battle import COLORS
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, BLANK, POISON
+from battle.shapes import COMPILED_SHAPES
+
+FULL_ROW = (1 << BOARD_WIDTH) - 1
+MIXED = None  # row color of a line holding more than one color
+# A line with a poison box in it has POISON for row color and is never complete.
+
+
+def compile_rows(shape):
+    """
+    Turn a compiled shape rotation into a tuple of ``(dy, lo, hi, mask)``
+    rows, one per row with a box in it. ``lo`` and ``hi`` are the left and
+    right-most x offsets and ``mask`` is the row bitmask shifted so that
+    bit 0 is ``lo``. Poison boxes take room like solid ones, so a piece
+    collides the same whatever it is made of.
+
+    @param shape:
+    """
+    cells = shape.cells + shape.poison_cells
+    rows = []
+    for y in sorted(set(y for _, y in cells)):
+        xs = sorted(x for x, cell_y in cells if cell_y == y)
+        mask = 0
+        for x in xs:
+            mask |= 1 << (x - xs[0])
+        rows.append((y, xs[0], xs[-1], mask))
+    return tuple(rows)
+
+
+SHAPE_ROWS = dict((name, tuple(compile_rows(shape) for shape in rotations))
+                  for name, rotations in COMPILED_SHAPES.items())
+# Every non blank box of a piece is written to the board when it lands, the
+# poison ones as POISON boxes.
+SHAPE_CELLS = dict((name, tuple(shape.cells + shape.poison_cells for shape in rotations))
+                   for name, rotations in COMPILED_SHAPES.items())
+SHAPE_SOLID_CELLS = dict((name, tuple(shape.cells for shape in rotations))
+                         for name, rotations in COMPILED_SHAPES.items())
+SHAPE_POISON_CELLS = dict((name, tuple(shape.poison_cells for shape in rotations))
+                          for name, rotations in COMPILED_SHAPES.items())
+
+
+def compile_bottoms(shape):
+    """
+    Turn a compiled shape rotation into a tuple of ``(dx, dy)`` holding the
+    lowest box of every column the shape covers.
+
+    @param shape:
+    """
+    bottoms = dict()
+    for x, y in shape.cells + shape.poison_cells:
+        bottoms[x] = max(y, bottoms.get(x, y))
+    return tuple(sorted(bottoms.items()))
+
+
+SHAPE_BOTTOMS = dict((name, tuple(compile_bottoms(shape) for shape in rotations))
+                     for name, rotations in COMPILED_SHAPES.items())
+
+
+def skyline(rows):
+    """
+    Return the y of the highest taken box of every column of the row
+    bitmasks, BOARD_HEIGHT for an empty column.
+    """
+    tops = [BOARD_HEIGHT] * BOARD_WIDTH
+    open_columns = FULL_ROW
+    for y, row in enumerate(rows):
+        row &= open_columns
+        if not row:
+            continue
+        open_columns &= ~row
+        while row:
+            bit = row & -row
+            tops[bit.bit_length() - 1] = y
+            row ^= bit
+        if not open_columns:
+            break
+    return tops
+
+
+def line_color(colors):
+    """
+    Return the row color of a line of colors.
+    """
+    taken = set(colors)
+    taken.discard(BLANK)
+    if POISON in taken:
+        return POISON
+    return taken.pop() if len(taken) == 1 else (BLANK if not taken else MIXED)
+
+
+def garbage_line(hole):
+    """
+    Return the colors of a garbage line with a gap at hole. The colors are
+    striped so a garbage line is never a single color.
+    """
+    return [BLANK if x == hole else x % len(COLORS) for x in range(BOARD_WIDTH)]
+
+
+class Board(object):
+    """
+    Playing field stored as one integer bitmask per row (bit x set when the
+    box at x is taken) with a separate row-major color plane that is only
+    needed to draw the board. Each row also remembers its single color (or
+    MIXED) and rows filled by add_piece are remembered until they are
+    removed, so complete and same color lines never need a scan. The
+    skyline (the y of the highest box of each column) is kept up to date
+    too, which gives the hard drop distance without stepping the piece.
+
+    Poison boxes take room like any other but the line they are in can
+    never be cleared.
+
+    The rows, colors and row colors are ring buffers (deques of
+    BOARD_HEIGHT lines): a removed line is taken out and a blank one put
+    in at the top, garbage goes in at the bottom and pushes the top line
+    out, both without touching the other lines.
+    """
+    rows = None
+    colors = None
+    row_colors = None
+    completed = None
+    tops = None
+    version = 0  # bumped whenever a box changes, lets renderers skip unchanged boards
+
+    def __init__(self):
+        self.rows = deque([0] * BOARD_HEIGHT, BOARD_HEIGHT)
+        self.colors = deque([[BLANK] * BOARD_WIDTH for _ in range(BOARD_HEIGHT)], BOARD_HEIGHT)
+        self.row_colors = deque([BLANK] * BOARD_HEIGHT, BOARD_HEIGHT)
+        self.completed = set()
+        self.tops = [BOARD_HEIGHT] * BOARD_WIDTH
+
+    @property
+    def poison(self):
+        """
+        Bitmask of the lines with a poison box in them, bit y for line y.
+        """
+        mask = 0
+        for y, color in enumerate(self.row_colors):
+            if color == POISON:
+                mask |= 1 << y
+        return mask
+
+    @property
+    def heights(self):
+        """
+        Height of the stack in every column, 0 for an empty one.
+        """
+        return [BOARD_HEIGHT - top for top in self.tops]
+
+    def is_valid_position(self, piece, adj_x=0, adj_y=0):
+        """
+        Return True if the piece is within the board and not colliding.
+        """
+        x = piece['x'] + adj_x
+        top = piece['y'] + adj_y
+        rows = self.rows
+        for dy, lo, hi, mask in SHAPE_ROWS[piece['shape']][piece['rotation']]:
+            y = top + dy
+            if y < 0:
+                continue  # above the board
+            if y >= BOARD_HEIGHT or x + lo < 0 or x + hi >= BOARD_WIDTH:
+                return False
+            if rows[y] & (mask << (x + lo)):
+                return False
+        return True
+
+    def drop_distance(self, piece):
+        """
+        Return how many rows the piece can fall before it lands. It is
+        worked out from the skyline and the lowest box of each column of
+        the piece; a piece that is not above the skyline in every column
+        (slid under an overhang) or hangs over the side above the board
+        is stepped down the slow way instead.
+        """
+        x = piece['x']
+        y = piece['y']
+        tops = self.tops
+        distance = BOARD_HEIGHT - y
+        for dx, dy in SHAPE_BOTTOMS[piece['shape']][piece['rotation']]:
+            column = x + dx
+            if column < 0 or column >= BOARD_WIDTH or y + dy >= tops[column]:
+                break
+            distance = min(distance, tops[column] - y - dy - 1)
+        else:
+            return distance
+        distance = 0
+        while self.is_valid_position(piece, adj_y=distance + 1):
+            distance += 1
+        return distance
+
+    def add_piece(self, piece):
+        """
+        Fill in the board based on piece's location, shape, and rotation
+        and return the set of lines that are complete.
+        """
+        self.version += 1
+        rows = self.rows
+        row_colors = self.row_colors
+        tops = self.tops
+        color = piece['color']
+        for dx, dy in SHAPE_SOLID_CELLS[piece['shape']][piece['rotation']]:
+            x = piece['x'] + dx
+            y = piece['y'] + dy
+            if y < 0:
+                continue
+            rows[y] |= 1 << x
+            if y < tops[x]:
+                tops[x] = y
+            self.colors[y][x] = color
+            if row_colors[y] == BLANK:
+                row_colors[y] = color
+            elif row_colors[y] != color and row_colors[y] != POISON:
+                row_colors[y] = MIXED
+            if rows[y] == FULL_ROW and row_colors[y] != POISON:
+                self.completed.add(y)
+        for dx, dy in SHAPE_POISON_CELLS[piece['shape']][piece['rotation']]:
+            x = piece['x'] + dx
+            y = piece['y'] + dy
+            if y < 0:
+                continue
+            rows[y] |= 1 << x
+            if y < tops[x]:
+                tops[x] = y
+            self.colors[y][x] = POISON
+            row_colors[y] = POISON
+            self.completed.discard(y)
+        return self.completed
+
+    def set_row(self, y, mask, colors):
+        """
+        Overwrite line y, e.g. to set a board up.
+
+        @param y:
+        @param mask: bitmask of the taken boxes
+        @param colors: list of BOARD_WIDTH colors (BLANK for a free box)
+        """
+        self.rows[y] = mask
+        self.colors[y] = list(colors)
+        self.row_colors[y] = line_color(colors)
+        if mask == FULL_ROW and self.row_colors[y] != POISON:
+            self.completed.add(y)
+        else:
+            self.completed.discard(y)
+        self.tops = skyline(self.rows)
+        self.version += 1
+
+    def load(self, colors):
+        """
+        Overwrite every line at once, e.g. when a snapshot is restored.
+
+        @param colors: BOARD_HEIGHT lists of BOARD_WIDTH colors, kept as they are
+        """
+        self.colors = deque(colors, BOARD_HEIGHT)
+        self.completed = set()
+        for y, line in enumerate(colors):
+            mask = 0
+            for x, color in enumerate(line):
+                if color != BLANK:
+                    mask |= 1 << x
+            self.rows[y] = mask
+            self.row_colors[y] = line_color(line)
+            if mask == FULL_ROW and self.row_colors[y] != POISON:
+                self.completed.add(y)
+        self.tops = skyline(self.rows)
+        self.version += 1
+
+    def is_completed_line_with_bonus(self, y):
+        """
+        Return (complete, bonus) where complete is True if the line is filled
+        with boxes with no gaps and no poison, and bonus is True if they all
+        share one color.
+        """
+        if self.rows[y] != FULL_ROW or self.row_colors[y] == POISON:
+            return False, False
+        return True, self.row_colors[y] is not MIXED
+
+    def remove_completed_lines(self):
+        """
+        Remove every complete line, the lines above dropping down as blank
+        ones come in at the top. Return the number of lines removed and how
+        many of them were a single color.
+        """
+        completed = self.completed
+        if not completed:
+            return 0, 0
+        bonus = sum(1 for y in completed if self.row_colors[y] is not MIXED)
+        # From the top down, so the lines still to remove keep their y
+        for y in sorted(completed):
+            del self.rows[y]
+            del self.colors[y]
+            del self.row_colors[y]
+            self.rows.appendleft(0)
+            self.colors.appendleft([BLANK] * BOARD_WIDTH)
+            self.row_colors.appendleft(BLANK)
+        count = len(completed)
+        self.completed = set()
+        self.tops = skyline(self.rows)
+        self.version += 1
+        return count, bonus
+
+    def add_garbage(self, count, hole):
+        """
+        Push count garbage lines, full but for a gap at hole, in at the
+        bottom, pushing every line up and the top ones out. Return True
+        if any box was pushed out.
+        """
+        count = min(count, BOARD_HEIGHT)
+        overflow = any(self.rows[y] for y in range(count))
+        mask = FULL_ROW & ~(1 << hole)
+        for _ in range(count):
+            self.rows.append(mask)
+            self.colors.append(garbage_line(hole))
+            self.row_colors.append(MIXED)
+        self.completed = set(y - count for y in self.completed if y >= count)
+        self.tops = skyline(self.rows)
+        self.version += 1
+        return overflow
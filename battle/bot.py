@@ -0,0 +1,203 @@
+import threading
+import time
+from battle.board import FULL_ROW, SHAPE_ROWS, SHAPE_BOTTOMS, SHAPE_CELLS, SHAPE_POISON_CELLS, skyline
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT
+
+# Weights of the board features, the higher the score the better the board.
+WEIGHTS = dict(height=-.51, lines=.76, holes=-.36, bumpiness=-.18, poison=-5.0)
+# (seconds to search a piece, seconds between two key presses)
+DIFFICULTIES = dict(easy=(.005, .3), normal=(.02, .12), hard=(.1, .04))
+CACHE_SIZE = 1 << 16
+TOPPED_OUT = float('-inf')
+
+
+def compile_lock_rows(cells):
+    """
+    Return ``(dy, mask)`` for every row of cells, mask shifted so that bit
+    0 is x offset 0.
+    """
+    rows = dict()
+    for x, y in cells:
+        rows[y] = rows.get(y, 0) | 1 << x
+    return tuple(sorted(rows.items()))
+
+
+# Solid and poison boxes alike are written to the board when a piece lands.
+LOCK_ROWS = dict((name, tuple(compile_lock_rows(cells) for cells in rotations))
+                 for name, rotations in SHAPE_CELLS.items())
+# The dy of every row a piece poisons when it lands
+POISON_ROWS = dict((name, tuple(tuple(sorted(set(y for _, y in cells))) for cells in rotations))
+                   for name, rotations in SHAPE_POISON_CELLS.items())
+
+
+def placements(rows, shape, poison=0):
+    """
+    Yield (rotation, x, rows, poison, lines) for every way shape can be
+    dropped straight down on to rows: where it ends up, the rows and
+    poisoned lines after it locked and the complete lines were removed,
+    and how many were. Poisoned lines are never removed. Placements that
+    lock above the board are left out.
+
+    @param rows: tuple of row bitmasks
+    @param shape: shape name
+    @param poison: bitmask of the poisoned lines, bit y for line y
+    """
+    tops = skyline(rows)
+    for rotation, bottoms in enumerate(SHAPE_BOTTOMS[shape]):
+        extent = SHAPE_ROWS[shape][rotation]
+        left = -min(lo for _, lo, _, _ in extent)
+        right = BOARD_WIDTH - 1 - max(hi for _, _, hi, _ in extent)
+        lock_rows = LOCK_ROWS[shape][rotation]
+        poison_rows = POISON_ROWS[shape][rotation]
+        for x in range(left, right + 1):
+            y = min(tops[x + dx] - dy - 1 for dx, dy in bottoms)
+            if y + lock_rows[0][0] < 0:
+                continue
+            after = list(rows)
+            for dy, mask in lock_rows:
+                after[y + dy] |= mask << x if x >= 0 else mask >> -x
+            poisoned = poison
+            for dy in poison_rows:
+                poisoned |= 1 << (y + dy)
+            if not poisoned:
+                kept = [row for row in after if row != FULL_ROW]
+                lines = BOARD_HEIGHT - len(kept)
+                yield rotation, x, tuple([0] * lines + kept), 0, lines
+                continue
+            kept = []
+            kept_poison = []
+            for line, row in enumerate(after):
+                if row != FULL_ROW or poisoned >> line & 1:
+                    kept.append(row)
+                    kept_poison.append(poisoned >> line & 1)
+            lines = BOARD_HEIGHT - len(kept)
+            poisoned = 0
+            for line, bit in enumerate(kept_poison):
+                poisoned |= bit << (lines + line)
+            yield rotation, x, tuple([0] * lines + kept), poisoned, lines
+
+
+def evaluate(rows, weights=WEIGHTS, poison=0):
+    """
+    Score a board on its aggregate height, holes (free boxes with a box
+    somewhere above them), bumpiness (height steps between columns) and
+    poisoned lines, which stay for good.
+    """
+    covered = 0
+    holes = 0
+    for row in rows:
+        holes += bin(covered & ~row).count('1')
+        covered |= row
+    heights = [BOARD_HEIGHT - top for top in skyline(rows)]
+    bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    return (weights['height'] * sum(heights) + weights['holes'] * holes + weights['bumpiness'] * bumpiness +
+            weights.get('poison', 0.0) * bin(poison).count('1'))
+
+
+class Search(object):
+    """
+    Finds the best place for a piece given the next one. Every placement
+    of the piece is scored on its own first, then the best of them are
+    looked at again with every placement of the next piece on top, for as
+    long as the deadline allows. Scores of the boards reached are kept in
+    a transposition cache keyed on the rows and poisoned lines (different
+    orders often give the same board), shared by every search of the same
+    Search.
+    """
+
+    def __init__(self, weights=WEIGHTS, cache_size=CACHE_SIZE):
+        self.weights = weights
+        self.cache_size = cache_size
+        self.cache = dict()
+        self.hits = 0
+
+    def score(self, rows, poison, lines):
+        key = (rows, poison)
+        value = self.cache.get(key)
+        if value is None:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            value = self.cache[key] = evaluate(rows, self.weights, poison)
+        else:
+            self.hits += 1
+        return value + self.weights['lines'] * lines
+
+    def best(self, rows, shape, next_shape=None, deadline=None, poison=0):
+        """
+        Return the (rotation, x) to drop shape at, None if every
+        placement tops out.
+
+        @param rows: tuple of row bitmasks
+        @param shape: name of the shape to place
+        @param next_shape: name of the shape after it, if known
+        @param deadline: time.perf_counter() to stop looking ahead at
+        @param poison: bitmask of the poisoned lines (Board.poison)
+        """
+        candidates = sorted(((self.score(after, poisoned, lines), rotation, x, after, poisoned, lines)
+                             for rotation, x, after, poisoned, lines in placements(rows, shape, poison)),
+                            reverse=True)
+        if not candidates:
+            return None
+        rotation, x = candidates[0][1:3]
+        if next_shape is None:
+            return rotation, x
+        best_value = TOPPED_OUT
+        for _, candidate_rotation, candidate_x, after, poisoned, lines in candidates:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            value = max([self.score(then, then_poison, lines + then_lines)
+                         for _, _, then, then_poison, then_lines in placements(after, next_shape, poisoned)]
+                        or [TOPPED_OUT])
+            if value > best_value:
+                best_value, rotation, x = value, candidate_rotation, candidate_x
+            time.sleep(0)  # let the game loop have the interpreter
+        return rotation, x
+
+
+class BotWorker(threading.Thread):
+    """
+    Runs searches on a thread of its own so the game loop never waits for
+    one. submit hands over a board and forgets any search not started yet;
+    result is polled every frame and is None until the search is done.
+    """
+    daemon = True
+    stopped = False
+
+    def __init__(self, search=None, think_time=.02):
+        super(BotWorker, self).__init__(name='bot')
+        self.search = search or Search()
+        self.think_time = think_time
+        self.condition = threading.Condition()
+        self.job = None
+        self.done = None
+
+    def submit(self, key, rows, shape, next_shape, poison=0):
+        with self.condition:
+            self.job = (key, rows, shape, next_shape, poison)
+            self.done = None
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def result(self, key):
+        done = self.done
+        if done is not None and done[0] == key:
+            return done[1]
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.job is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                key, rows, shape, next_shape, poison = self.job
+                self.job = None
+            placement = self.search.best(rows, shape, next_shape, time.perf_counter() + self.think_time, poison)
+            with self.condition:
+                if self.job is None:
+                    self.done = (key, placement)
@@ -1,4 +1,7 @@
 FPS = 25
+TICK_RATE = 100  # game logic steps a second, independent of FPS
+MAX_TICKS_PER_FRAME = 25  # more than that and the game slows down instead
+FRAME_SKIP = 2  # frames in a row that may go undrawn to catch up, 0 to draw every one
 WINDOW_WIDTH = 640
 WINDOW_HEIGHT = 480
 BOX_SIZE = 20
@@ -6,8 +9,14 @@ BOARD_WIDTH = 10
 BOARD_HEIGHT = 20
 BLANK = '.'
 POISON = '-'
+POISON_RATE = 0.05  # chance of a piece being a poison one
 MOVE_SIDE_WAYS_FREQ = 0.15
 MOVE_DOWN_FREQ = 0.1
+SOUND = True  # music and sound effects, played on a thread of their own
+STATS_FILE = None  # frame time summaries are appended here when set
+STATS_EXPORT_FREQ = 10.0
+GRID_MIN_BOARDS = 4  # boards a grid view shows at least, fewer leave it mostly empty
+GRID_MAX_BOARDS = 64  # more do not fit the window
 
 TEMPLATE_WIDTH = 5
 TEMPLATE_HEIGHT = 5
@@ -0,0 +1,315 @@
+import time
+from battle.configs import MOVE_DOWN_FREQ, MOVE_SIDE_WAYS_FREQ, BOARD_HEIGHT, BOARD_WIDTH
+from battle.shapes import COMPILED_SHAPES
+from battle.utils import PieceStream, get_blank_board, calculate_level_and_fall_frequency, is_valid_position
+
+# Actions a player can take. Each one is either pressed or released.
+MOVE_LEFT = 0
+MOVE_RIGHT = 1
+MOVE_DOWN = 2
+ROTATE = 3
+ROTATE_BACK = 4
+DROP = 5
+ACTIONS = (MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN, ROTATE, ROTATE_BACK, DROP)
+
+# Garbage lines sent to the opponent for clearing 0, 1, 2, 3 and 4 lines
+# at once, plus one for every single color line.
+ATTACK_LINES = (0, 0, 1, 2, 4)
+HOLE_HASH = 2654435761  # spreads the turns over the columns for the gap of an attack
+
+
+class MatchClock(object):
+    """
+    Clock for engines stepped at known times, e.g. from the network or a
+    replay. Time is kept in whole milliseconds from the start of the match
+    so the same steps always give exactly the same floats.
+    """
+    ms = 0
+
+    def __call__(self):
+        return self.ms / 1000.0
+
+
+class Engine(object):
+    """
+    Display free game rules for one player's board and falling piece, driven
+    by actions (apply_action) or ticks (step). Time only comes from the
+    injected clock or the dt handed to step, so games can run headless and
+    faster than real time.
+    """
+    board = None
+    bangs = 3.0
+    now = None
+    last_move_down_time = now
+    last_move_sideways_time = now
+    last_fall_time = now
+    moving_down = False  # Note: there is no moving_up variable
+    moving_left = False
+    moving_right = False
+    score = 0
+    lines = 0
+    bonus_lines = 0
+    bonus_score = 4  # extra points for a line of a single color
+    level = 0
+    turn = 0
+    fall_frequency = 0
+    falling_piece = None
+    next_piece = None
+    game_over = False
+    garbage = None  # hole of every garbage line on its way in, added when the next piece locks
+    attacks = None  # (lines, hole) attacks made since exchange_garbage last ran
+
+    def __init__(self, now=None, clock=time.time, get_piece=None):
+        """
+        @param now: start time, read from clock when not given
+        @param clock: callable returning the current time in seconds
+        @param get_piece: callable returning the piece for a turn, a reader
+                          of a PieceStream of its own by default
+        """
+        self.clock = clock
+        if now is None:
+            self.now = clock()
+        else:
+            self.now = now
+        self.get_piece = get_piece or PieceStream().reader()
+        self.board = get_blank_board()
+        self.garbage = []
+        self.attacks = []
+        self.reset_timers(self.now)
+        self.update_level()
+        self.deal()
+
+    def deal(self):
+        """
+        Take the first two pieces of the game from get_piece.
+        """
+        self.falling_piece = self.get_piece(0)
+        self.next_piece = self.get_piece(1)
+        self.turn = 1
+
+    def reset_timers(self, now):
+        """
+        Restart gravity and key repeat from now, e.g. after a pause.
+        """
+        self.last_move_down_time = self.last_fall_time = self.last_move_sideways_time = now
+
+    def update_level(self):
+        self.level, self.fall_frequency = calculate_level_and_fall_frequency(self.score)
+
+    def update_falling_piece(self, now):
+        if self.game_over:
+            return
+        self.falling_piece = self.next_piece
+        self.turn += 1
+        self.next_piece = self.get_piece(self.turn)
+        self.last_fall_time = now
+
+    def spawn(self, now):
+        """
+        Start a new piece at the top if none is falling and return
+        True when the falling piece does not fit, i.e. the game is over.
+        """
+        if self.game_over:
+            return True  # e.g. topped out by garbage
+        if self.falling_piece is None:
+            self.update_falling_piece(now)
+        self.game_over = not is_valid_position(self.board, self.falling_piece)
+        return self.game_over
+
+    def step(self, inputs=(), dt=None):
+        """
+        Advance the game by one tick: spawn a piece if needed, apply the
+        (action, pressed) inputs and then move the piece. When dt is None
+        the time is read from the clock, otherwise the game moves dt seconds
+        forward. Return True when the game is over.
+
+        @param inputs:
+        @param dt:
+        """
+        now = self.clock() if dt is None else self.now + dt
+        self.now = now
+        if self.spawn(now):
+            self.release_pieces()
+            return True
+        for action, pressed in inputs:
+            self.apply_action(action, pressed)
+        self.calculate_moves(now)
+        if self.game_over:
+            self.release_pieces()
+        return self.game_over
+
+    def release_pieces(self):
+        """
+        Give up the reader of the piece stream once the game is over, so the
+        pieces of the other players are not held back for it.
+        """
+        release = getattr(self.get_piece, 'release', None)
+        if release is not None:
+            release()
+
+    def remove_completed_line(self):
+        """
+        Remove any completed lines on the board, move everything above them
+        down, and return the number of complete lines.
+        """
+        if self.game_over:
+            return 0
+        lines, bonus_lines = self.board.remove_completed_lines()
+        self.lines += lines
+        self.bonus_lines += bonus_lines
+        num_lines_removes = lines + self.bonus_score * bonus_lines
+        if num_lines_removes:
+            self.score += num_lines_removes
+            self.update_level()
+            self.bangs += num_lines_removes * .25  # One new bang every four lines
+            self.attack(ATTACK_LINES[min(lines, len(ATTACK_LINES) - 1)] + bonus_lines)
+        return lines
+
+    def attack(self, lines):
+        """
+        Use lines garbage lines against the garbage on its way in first and
+        send the rest on to the opponent, all with one gap.
+        """
+        cancelled = min(lines, len(self.garbage))
+        del self.garbage[:cancelled]
+        if lines > cancelled:
+            # Worked out from the turn so replays and replicas get the same gap
+            self.attacks.append((lines - cancelled, (self.turn * HOLE_HASH >> 16) % BOARD_WIDTH))
+
+    def receive_garbage(self, lines, hole):
+        self.garbage.extend([hole] * lines)
+        del self.garbage[BOARD_HEIGHT:]  # any more would top out all the same
+
+    def add_garbage(self):
+        """
+        Push the garbage on its way in into the board, which is over when
+        boxes are pushed out at the top.
+        """
+        while self.garbage:
+            hole = self.garbage[0]
+            count = 1
+            while count < len(self.garbage) and self.garbage[count] == hole:
+                count += 1
+            del self.garbage[:count]
+            if self.board.add_garbage(count, hole):
+                self.game_over = True
+
+    def is_completed_line_with_bonus(self, y):
+        """
+        Return True is the line filled with boxes with no gaps.
+        """
+        return self.board.is_completed_line_with_bonus(y)
+
+    @property
+    def rotations(self):
+        """
+        Number of rotations the falling piece has.
+        """
+        return COMPILED_SHAPES[self.falling_piece['shape']][0].rotations
+
+    def apply_action(self, action, pressed=True):
+        """
+        Press or release one of the ACTIONS.
+
+        @param action:
+        @param pressed:
+        """
+        if self.game_over or self.falling_piece is None:
+            return
+        if not pressed:
+            if action == MOVE_LEFT:
+                self.moving_left = False
+            elif action == MOVE_RIGHT:
+                self.moving_right = False
+            elif action == MOVE_DOWN:
+                self.moving_down = False
+            return
+
+        # moving the block sideways
+        if action == MOVE_LEFT and is_valid_position(self.board, self.falling_piece, adj_x=-1):
+            self.falling_piece['x'] -= 1
+            self.moving_left = True
+            self.moving_right = False
+            self.last_move_sideways_time = self.now
+        elif action == MOVE_RIGHT and is_valid_position(self.board, self.falling_piece, adj_x=1):
+            self.falling_piece['x'] += 1
+            self.moving_left = False
+            self.moving_right = True
+            self.last_move_sideways_time = self.now
+        # Rotating the block (if there is room to rotate)
+        elif action == ROTATE:
+            self.falling_piece['rotation'] = (self.falling_piece['rotation'] + 1) % self.rotations
+            if not is_valid_position(self.board, self.falling_piece):
+                self.falling_piece['rotation'] = (self.falling_piece['rotation'] - 1) % self.rotations
+        elif action == ROTATE_BACK:
+            self.falling_piece['rotation'] = (self.falling_piece['rotation'] - 1) % self.rotations
+            if not is_valid_position(self.board, self.falling_piece):
+                self.falling_piece['rotation'] = (self.falling_piece['rotation'] + 1) % self.rotations
+
+        # Make the block fall faster with the down key
+        elif action == MOVE_DOWN:
+            self.moving_down = True
+            if is_valid_position(self.board, self.falling_piece, adj_y=1):
+                self.falling_piece['y'] += 1
+            self.last_move_down_time = self.now
+
+        # Move the current block all the way down
+        elif action == DROP:
+            self.moving_down = False
+            self.moving_left = False
+            self.moving_right = False
+            # Never more than BOARD_HEIGHT - 2 rows at once, as the old
+            # stepping loop did, so recorded games keep playing the same.
+            self.falling_piece['y'] += min(self.board.drop_distance(self.falling_piece), BOARD_HEIGHT - 2)
+
+    def calculate_moves(self, now):
+        if self.game_over:
+            return
+        # Handling moving the block because of user input
+        if (self.moving_left or self.moving_right) and now - self.last_move_sideways_time > MOVE_SIDE_WAYS_FREQ:
+            if self.moving_left and is_valid_position(self.board, self.falling_piece, adj_x=-1):
+                self.falling_piece['x'] -= 1
+            elif self.moving_right and is_valid_position(self.board, self.falling_piece, adj_x=1):
+                self.falling_piece['x'] += 1
+            self.last_move_sideways_time = now
+        if self.moving_down and now - self.last_move_down_time > MOVE_DOWN_FREQ and is_valid_position(self.board, self.falling_piece, adj_y=1):
+            self.falling_piece['y'] += 1
+            self.last_move_down_time = now
+
+        # Let the piece fall if it is time to fall
+        if now - self.last_fall_time > self.fall_frequency:
+            # See if the piece has landed.
+            if not is_valid_position(self.board, self.falling_piece, adj_y=1):
+                # falling piece has landed, set it on the self.board
+                self.add_to_board(self.falling_piece)
+                if not self.remove_completed_line():
+                    self.add_garbage()
+                self.falling_piece = None
+            else:
+                # piece did not land just move it down one block
+                self.falling_piece['y'] += 1
+                self.last_fall_time = now
+
+    def add_to_board(self, piece):
+        """
+        Fill in the board based on piece's location, shape, and rotation
+        """
+        self.board.add_piece(piece)
+
+
+def exchange_garbage(engines):
+    """
+    Hand the attacks every engine made since the last call to the next
+    engine still playing. Call it after every step of all the engines of
+    a match, in the same order everywhere the match is played.
+    """
+    for i, engine in enumerate(engines):
+        if not engine.attacks:
+            continue
+        attacks, engine.attacks = engine.attacks, []
+        for step in range(1, len(engines)):
+            target = engines[(i + step) % len(engines)]
+            if not target.game_over:
+                for lines, hole in attacks:
+                    target.receive_garbage(lines, hole)
+                break
@@ -0,0 +1,743 @@
+import argparse
+import os
+import pygame
+import random
+import sys
+import time
+from operator import itemgetter
+from battle import BG_COLOR, BORDER_COLOR, TEXT_COLOR, TEXT_SHADOW
+from battle.configs import *
+from battle.shapes import COMPILED_SHAPES
+from battle.utils import PieceStream
+from battle.engine import MatchClock, exchange_garbage
+from battle.replay import ReplayReader, ReplayWriter
+from battle.render import BoardRenderer, Fonts, GridView, TileAtlas, text_cache
+from battle.audio import Audio, BONUS, GAME_OVER, LINE
+from battle.stats import FrameStats, PHASES, INPUT, SIMULATION, RENDER, PRESENT
+from pygame.locals import *
+
+
+def is_quit(event):
+    return event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE)
+
+
+def terminate(audio=None):
+    """
+    Close the window and exit. The audio thread, if any, is closed first
+    so it is done with the mixer before pygame shuts it down.
+    """
+    if audio is not None:
+        audio.close()
+    pygame.quit()
+    sys.exit()
+
+
+def check_for_key_press(audio=None):
+    """
+    Go through event queue looking for a KEYUP event.
+    Grab KEYDOWN events and remove them from the event queue.
+    """
+    for event in pygame.event.get([QUIT, KEYDOWN, KEYUP]):
+        if is_quit(event):
+            terminate(audio)
+        if event.type == KEYUP:
+            return event.key
+    return None
+
+
+
+class BattleTetro(object):
+    clock = None
+    surface = None
+    fonts = None
+    now = None
+    players = list()
+    renderers = list()
+    atlas = None
+    panel_state = None
+    stats = None
+    show_stats = False
+    stats_state = None
+    pending = None
+    skipped = 0
+    keymap = dict()
+    broadcast = None
+    grid = None
+    audio = None
+    heard = None  # lines and bonus lines of every player the effects were played for
+
+    def __init__(self, record_dir=None, stats_file=STATS_FILE, bot=None, spectate_port=None, sound=SOUND):
+        """
+        @param record_dir: directory to record a replay of every game to
+        @param stats_file: file to append frame time summaries to
+        @param bot: difficulty of a computer player on the right, e.g. 'normal'
+        @param spectate_port: port to let viewers watch the games on
+        @param sound: play music and sound effects
+        """
+        self.record_dir = record_dir
+        self.bot = bot
+        self.spectate_port = spectate_port
+        # Only the display is started here, fonts load when first drawn and
+        # the mixer is started by the audio thread.
+        pygame.display.init()
+        self.clock = pygame.time.Clock()
+        self.surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        self.fonts = Fonts()
+        self.stats = FrameStats(FPS, path=stats_file, export_every=STATS_EXPORT_FREQ)
+        pygame.display.set_caption('Tetromino')
+        self.atlas = TileAtlas()
+        if sound:
+            self.audio = Audio()
+            self.audio.start()  # preloads while the first frames are drawn
+            self.stats.audio = self.audio.latencies
+
+    def execute(self):
+        while True:
+            if self.audio is not None and self.audio.tracks:
+                self.audio.play_music(random.choice(self.audio.tracks))
+            self.run_game()
+            if self.audio is not None:
+                self.audio.stop_music()
+                self.audio.play_effect(GAME_OVER)
+            self.show_text_screen('Game Over')
+
+    def run_game(self):
+        # Setup variable for the start of the game
+        self.now = time.time()
+        player_count = 2  # self.get_number_of_players()  # TODO: Work this out as network or local. Two is max.
+        pieces = PieceStream(readers=player_count)
+        match_clock = MatchClock()
+
+        self.players = list()
+        for i in range(player_count):
+            from battle.player import Player
+            if self.bot is not None and i == player_count - 1:
+                from battle.player import BotPlayer
+                player = BotPlayer(0.0, i, (player_count == 1), self.bot, clock=match_clock, get_piece=pieces.reader())
+            else:
+                player = Player(0.0, i, (player_count == 1), clock=match_clock, get_piece=pieces.reader())
+            player.border_color = BORDER_COLOR[i]
+            self.players.append(player)
+        self.setup_renderers()
+        self.setup_input()
+        self.start_broadcast()
+        self.heard = None
+
+        recorder = None
+        if self.record_dir is not None:
+            recorder = ReplayWriter(os.path.join(self.record_dir, '%d-%d.btr' % (self.now, pieces.seed)),
+                                    pieces.seed, player_count)
+        try:
+            self.play(match_clock, recorder)
+        finally:
+            if recorder is not None:
+                recorder.close()
+            for player in self.players:
+                if getattr(player, 'worker', None) is not None:
+                    player.worker.stop()
+
+    def run_grid(self, count=16, bot='normal'):
+        """
+        Watch count computer players play on one screen until every board
+        is over, each attack going to the next board still playing.
+
+        @param count: number of boards, GRID_MIN_BOARDS to GRID_MAX_BOARDS
+        @param bot: difficulty of the players
+        """
+        if not GRID_MIN_BOARDS <= count <= GRID_MAX_BOARDS:
+            raise ValueError('a grid shows %d to %d boards, not %d' % (GRID_MIN_BOARDS, GRID_MAX_BOARDS, count))
+        from battle.player import BotPlayer
+        self.now = time.time()
+        pieces = PieceStream(readers=count)
+        match_clock = MatchClock()
+        self.players = [BotPlayer(0.0, 0, True, bot, clock=match_clock, get_piece=pieces.reader())
+                        for _ in range(count)]
+        self.setup_renderers()
+        self.setup_input()
+        try:
+            self.play(match_clock)
+        finally:
+            for player in self.players:
+                player.worker.stop()
+
+    def play(self, match_clock, recorder=None):
+        """
+        Run the game loop until every player is out. The game is stepped
+        TICK_RATE times a second of play however fast frames are drawn.
+
+        @param match_clock: MatchClock of the players' engines
+        @param recorder: ReplayWriter the inputs and steps are logged to
+        """
+        self.pending = None
+        self.skipped = 0
+        self.stats.begin()
+        while self.frame(match_clock, recorder):
+            self.stats.end(self.clock.tick(FPS))
+            self.stats.begin()
+
+    def setup_input(self, players=None):
+        """
+        Map every key of the players (every player by default) to its
+        (player, action) pair, so a key press is routed with a single dict
+        lookup.
+        """
+        self.keymap = dict()
+        for player in players or self.players:
+            for key, action in player.keymap.items():
+                self.keymap.setdefault(key, (player, action))
+
+    def read_input(self):
+        """
+        Drain the event queue once and return (ms, player, action, pressed)
+        for every game key, ms being the match time the key was pressed or
+        released at. Events stamped by pygame keep their own time, the rest
+        count as made now. Quitting, pausing and the overlay are dealt with
+        here too. F3 shows the frame times.
+        """
+        inputs = []
+        now = time.time()
+        ticks = pygame.time.get_ticks()
+        for event in pygame.event.get():
+            if is_quit(event):
+                terminate(self.audio)
+            elif event.type == KEYUP and event.key == K_p:
+                if len(self.players) > 1:
+                    continue
+                # Pausing the game
+                self.surface.fill(BG_COLOR)
+                if self.audio is not None:
+                    self.audio.pause_music()
+                paused = time.time()
+                self.show_text_screen('Paused')  # pause until a key press
+                if self.audio is not None:
+                    self.audio.resume_music()
+                self.now += time.time() - paused  # the match clock stands still while paused
+                now = time.time()
+                ticks = pygame.time.get_ticks()
+                self.redraw()
+                self.stats.begin()  # leave the pause out of the frame times
+            elif event.type == KEYUP and event.key == K_F3:
+                self.toggle_stats()
+            elif event.type in (KEYDOWN, KEYUP):
+                target = self.keymap.get(event.key)
+                if target is None:
+                    continue
+                stamp = now
+                if ticks and hasattr(event, 'timestamp'):  # no ticks before pygame's timer is started
+                    stamp -= (ticks - event.timestamp) / 1000.0
+                inputs.append((int((stamp - self.now) * 1000), target[0], target[1], event.type == KEYDOWN))
+        return inputs
+
+    def frame(self, match_clock, recorder=None):
+        """
+        Handle the input, step every player for as many ticks as the time
+        since the last frame holds and draw one frame, unless the game is
+        behind and FRAME_SKIP allows to leave it out. Each input goes to
+        the first tick at or after the time it was made. Return False once
+        no player can go on.
+        """
+        inputs = (self.pending or []) + self.read_input()
+        for player in self.players:
+            inputs.extend((match_clock.ms, player, action, pressed) for action, pressed in player.plan())
+        inputs.sort(key=itemgetter(0))
+        self.stats.mark(INPUT)
+
+        tick = 1000 // TICK_RATE
+        target = int((time.time() - self.now) * 1000)
+        ticks = min((target - match_clock.ms) // tick, MAX_TICKS_PER_FRAME)
+        if ticks < 0:
+            ticks = 0
+        if match_clock.ms + (ticks + 1) * tick <= target:
+            # Too far behind to catch up, let the game run slower for a bit
+            self.now += (target - match_clock.ms - ticks * tick) / 1000.0
+        last = match_clock.ms + ticks * tick
+        done = 0
+        for _ in range(ticks):
+            match_clock.ms += tick
+            due = dict((player, []) for player in self.players)
+            # Whatever came in after the last tick of the frame is due at it
+            while done < len(inputs) and min(inputs[done][0], last) <= match_clock.ms:
+                _, player, action, pressed = inputs[done]
+                due[player].append((action, pressed))
+                done += 1
+            if recorder is not None:
+                for i, player in enumerate(self.players):
+                    for action, pressed in due[player]:
+                        recorder.event(i, action, pressed)
+                recorder.step(match_clock.ms)
+            stop_play = True
+            for player in self.players:
+                stop_play = player.step(due[player]) and stop_play
+            exchange_garbage(self.players)
+            if stop_play:
+                self.publish(match_clock.ms)
+                return False  # can't fit a new piece on the board, so game over
+        # Inputs that came in before the first tick wait for it
+        self.pending = inputs[done:]
+        self.play_effects()
+        self.publish(match_clock.ms)
+        self.stats.mark(SIMULATION)
+
+        if self.skipped < FRAME_SKIP and match_clock.ms + tick <= int((time.time() - self.now) * 1000):
+            self.skipped += 1  # behind already, catch up before drawing
+        else:
+            self.skipped = 0
+            self.draw_frame()
+        return True
+
+    def play_effects(self):
+        """
+        Queue the sound of the lines the players cleared since the last
+        call, one effect a frame at most.
+        """
+        if self.audio is None:
+            return
+        heard = [(player.lines, player.bonus_lines) for player in self.players]
+        if self.heard is not None and len(self.heard) == len(heard):
+            lines = sum(now[0] - then[0] for now, then in zip(heard, self.heard))
+            bonus = sum(now[1] - then[1] for now, then in zip(heard, self.heard))
+            if bonus > 0:
+                self.audio.play_effect(BONUS)
+            elif lines > 0:
+                self.audio.play_effect(LINE)
+        self.heard = heard
+
+    def start_broadcast(self):
+        """
+        Let viewers watch the players on spectate_port, listening the first
+        time round.
+        """
+        if self.spectate_port is None:
+            return
+        if self.broadcast is None:
+            from twisted.internet import reactor
+            from battle.spectate import Broadcast, BroadcastFactory
+            self.broadcast = Broadcast()
+            reactor.listenTCP(self.spectate_port, BroadcastFactory(self.broadcast))
+        self.broadcast.start(self.players)
+
+    def publish(self, ms):
+        """
+        Send what changed this frame to the viewers, if any, without ever
+        waiting on them.
+        """
+        if self.broadcast is None:
+            return
+        from twisted.internet import reactor
+        self.broadcast.publish(ms)
+        reactor.iterate(0)
+
+    def run_spectator(self, address='127.0.0.1', port=None):
+        """
+        Watch the games broadcast by the BattleTetro at address until it
+        goes away.
+
+        @param address:
+        @param port:
+        """
+        from twisted.internet import reactor
+        from battle.player import Player
+        from battle.spectate import Spectator, SpectatorFactory, PORT
+
+        def new_player(i):
+            player = Player(None, i, False, clock=MatchClock())
+            player.border_color = BORDER_COLOR[i]
+            return player
+
+        spectator = Spectator(new_player)
+        factory = SpectatorFactory(spectator)
+        reactor.connectTCP(address, port or PORT, factory)
+        while not factory.lost:
+            self.stats.begin()
+            for event in pygame.event.get():
+                if is_quit(event):
+                    terminate(self.audio)
+                elif event.type == KEYUP and event.key == K_F3:
+                    self.toggle_stats()
+            self.stats.mark(INPUT)
+            reactor.iterate(0)
+            self.stats.mark(SIMULATION)
+            if spectator.engines:
+                if spectator.engines != self.players:
+                    self.players = spectator.engines
+                    self.setup_renderers()
+                self.draw_frame()
+            self.stats.end(self.clock.tick(FPS))
+
+    def run_replay(self, path):
+        """
+        Play a recorded game back in real time.
+
+        @param path:
+        """
+        from battle.player import Player
+        replay = ReplayReader(path)
+        match_clock = MatchClock()
+        pieces = PieceStream(replay.seed, readers=replay.players)
+        self.players = list()
+        for i in range(replay.players):
+            player = Player(0.0, i, replay.players == 1, clock=match_clock, get_piece=pieces.reader())
+            player.border_color = BORDER_COLOR[i]
+            self.players.append(player)
+        self.setup_renderers()
+
+        start = time.time()
+        for ms, inputs in replay.steps():
+            for event in pygame.event.get():
+                if is_quit(event):
+                    terminate(self.audio)
+            wait = ms - int((time.time() - start) * 1000)
+            if wait > 0:
+                pygame.time.wait(wait)
+            self.stats.begin()
+            match_clock.ms = ms
+            for player, player_inputs in zip(self.players, inputs):
+                player.step(player_inputs)
+            exchange_garbage(self.players)
+            self.stats.mark(SIMULATION)
+            self.draw_frame()
+            self.stats.end()
+        replay.close()
+
+    def run_network_game(self, address=None, port=None):
+        """
+        Play a 1v1 match over the network. Host it when address is None,
+        otherwise join the host at address. The local player is on the left
+        and the replica of the remote player on the right.
+
+        @param address:
+        @param port:
+        """
+        from twisted.internet import reactor
+        from battle.network import MatchFactory, PORT
+        from battle.player import Player, BOARD_OFFSET
+
+        local = Player(None, 0, True)
+        local.board_offset = BOARD_OFFSET[0]
+        local.border_color = BORDER_COLOR[0]
+        matches = list()
+        ended = list()
+        factory = MatchFactory(address is None, local=local, on_start=matches.append, on_end=ended.append)
+        if address is None:
+            reactor.listenTCP(port or PORT, factory)
+        else:
+            reactor.connectTCP(address, port or PORT, factory)
+        while not matches:
+            for event in pygame.event.get():
+                if is_quit(event):
+                    terminate(self.audio)
+            reactor.iterate(1.0 / FPS)
+
+        match = matches[0]
+        match.remote.board_offset = BOARD_OFFSET[1]
+        match.remote.border_color = BORDER_COLOR[1]
+        self.players = [local, match.remote]
+        self.setup_renderers()
+        self.setup_input([local])
+        self.now = time.time()
+        while not ended:
+            self.stats.begin()
+            inputs = [(action, pressed) for _, _, action, pressed in self.read_input()]
+            inputs.extend(local.plan())
+            self.stats.mark(INPUT)
+            match.tick(int((time.time() - self.now) * 1000), inputs)
+            reactor.iterate(0)
+            self.stats.mark(SIMULATION)
+            if local.game_over and match.remote.game_over:
+                return
+            self.draw_frame()
+            self.stats.end(self.clock.tick(FPS))
+
+    def setup_renderers(self):
+        """
+        Make a renderer for each player and paint the whole window. With
+        more players than fit side by side they are shown in a GridView
+        left of the panel.
+        """
+        if len(self.players) > len(BORDER_COLOR):
+            self.renderers = []
+            self.grid = GridView(len(self.players), pygame.Rect(0, 0, WINDOW_WIDTH - 140, WINDOW_HEIGHT),
+                                 self.atlas, BORDER_COLOR)
+        else:
+            self.renderers = [BoardRenderer(player.board_offset, player.border_color, self.atlas)
+                              for player in self.players]
+            self.grid = None
+        self.redraw()
+
+    def draw_frame(self):
+        """
+        Draw what changed on to the screen and only push those parts.
+        """
+        dirty = self.draw_panel()
+        dirty.extend(self.draw_stats())
+        for player, renderer in zip(self.players, self.renderers):
+            dirty.extend(renderer.draw(self.surface, player.board, player.falling_piece))
+        if self.grid is not None:
+            dirty.extend(self.grid.draw(self.surface, self.players))
+        self.stats.mark(RENDER)
+        if dirty:
+            pygame.display.update(dirty)
+        self.stats.mark(PRESENT)
+
+    def redraw(self):
+        """
+        Repaint the whole window, e.g. after a text screen covered it.
+        """
+        self.surface.fill(BG_COLOR)
+        self.panel_state = None
+        self.draw_panel()
+        self.draw_stats()
+        for player, renderer in zip(self.players, self.renderers):
+            renderer.draw(self.surface, player.board, player.falling_piece)
+            renderer.draw_all(self.surface)
+        if self.grid is not None:
+            self.grid.draw(self.surface, self.players, force=True)
+        pygame.display.update()
+
+    def draw_panel(self):
+        """
+        Redraw the score, level and next pieces if any of them changed
+        and return the list of dirty rects.
+        """
+        shown = self.players[:len(BORDER_COLOR)]  # the panel has room for two next pieces
+        state = (self.players[0].score, self.players[0].level,
+                 [sorted(player.next_piece.items()) for player in shown if player.next_piece])
+        if state == self.panel_state:
+            return []
+        self.panel_state = state
+        self.stats_state = None  # the fill below covers the overlay
+        rect = pygame.Rect(WINDOW_WIDTH - 140, 0, 140, WINDOW_HEIGHT)
+        self.surface.fill(BG_COLOR, rect)
+        self.draw_status(self.players[0].score, self.players[0].level)
+        self.draw_next_piece()
+        return [rect]
+
+    def toggle_stats(self):
+        self.show_stats = not self.show_stats
+        self.stats_state = None
+
+    def draw_stats(self):
+        """
+        Draw the frame time overlay at the bottom of the panel, once a
+        second so it costs next to nothing, and return the dirty rects.
+        """
+        state = (self.show_stats, self.show_stats and self.stats.frames // FPS)
+        if state == self.stats_state:
+            return []
+        self.stats_state = state
+        rect = pygame.Rect(WINDOW_WIDTH - 140, WINDOW_HEIGHT - 115, 140, 115)
+        self.surface.fill(BG_COLOR, rect)
+        if self.show_stats:
+            summary = self.stats.summary()
+            lines = ['fps %.1f  dropped %d' % (summary['fps'], summary['dropped']),
+                     'frame %.1f/%.1f/%.1f ms' % (summary['frame']['p50'], summary['frame']['p95'],
+                                                  summary['frame']['p99']),
+                     'worst %.1f ms' % summary['worst']]
+            lines.extend('%s p95 %.2f ms' % (phase, summary[phase]['p95']) for phase in PHASES)
+            if 'audio' in summary:
+                lines.append('audio p95 %.2f ms' % summary['audio']['p95'])
+            for i, line in enumerate(lines):
+                self.surface.blit(self.fonts['small'].render(line, True, TEXT_COLOR), (rect.left, rect.top + i * 13))
+        return [rect]
+
+    def show_text_screen(self, text):
+        """
+        This function displays large text in the
+        center of the screen until a key is pressed.
+        Draw the text drop shadow
+        @param text:
+        """
+        title_surface, title_rect = self.make_text_objects(text, self.fonts['big'], TEXT_SHADOW)
+        title_rect.center = (int(WINDOW_WIDTH / 2), int(WINDOW_HEIGHT / 2))
+        self.surface.blit(title_surface, title_rect)
+
+        # Draw the text
+        title_surface, title_rect = self.make_text_objects(text, self.fonts['big'], TEXT_COLOR)
+        title_rect.center = (int(WINDOW_WIDTH / 2) - 3, int(WINDOW_HEIGHT / 2) - 3)
+        self.surface.blit(title_surface, title_rect)
+
+        # Draw the additional "Press a key to play." text.
+        press_key_surface, press_key_rect = self.make_text_objects('Press a key to play.', self.fonts['basic'], TEXT_COLOR)
+        press_key_rect.center = (int(WINDOW_WIDTH / 2), 20)
+        self.surface.blit(press_key_surface, press_key_rect)
+
+        while check_for_key_press(self.audio) is None:
+            pygame.display.update()
+            self.clock.tick()
+
+        self.surface.fill(BG_COLOR)
+        pygame.display.flip()
+
+    def get_number_of_players(self):
+        self.surface.fill(BG_COLOR)
+        text = 'Players?'
+        title_surface, title_rect = self.make_text_objects(text, self.fonts['big'], TEXT_SHADOW)
+        title_rect.center = (int(WINDOW_WIDTH / 2), int(WINDOW_HEIGHT / 2))
+        self.surface.blit(title_surface, title_rect)
+
+        # Draw the text
+        title_surface, title_rect = self.make_text_objects(text, self.fonts['big'], TEXT_COLOR)
+        title_rect.center = (int(WINDOW_WIDTH / 2) - 3, int(WINDOW_HEIGHT / 2) - 3)
+        self.surface.blit(title_surface, title_rect)
+
+        # Draw the additional "Press a key to play." text.
+        press_key_surface, press_key_rect = self.make_text_objects('Press Enter 1 or 2.', self.fonts['basic'], TEXT_COLOR)
+        press_key_rect.center = (int(WINDOW_WIDTH / 2), 20)
+        self.surface.blit(press_key_surface, press_key_rect)
+
+        font = pygame.font.Font(None, 50)
+        num_players = ""
+        while True:
+            for evt in pygame.event.get():
+                if evt.type == KEYDOWN:
+                    if evt.unicode.isalpha():
+                        num_players += evt.unicode
+                    elif evt.key == K_BACKSPACE:
+                        name = num_players[:-1]
+                    elif evt.key == K_RETURN:
+                        num_players = ""
+                elif evt.type == QUIT:
+                    return
+
+            block = font.render(num_players, True, TEXT_COLOR)
+            rect = block.get_rect()
+            rect.center = self.surface.get_rect().center
+            self.surface.blit(block, rect)
+            pygame.display.update()
+        return int(num_players)
+
+    def draw_box(self, box_x, box_y, color, pixel_x=None, pixel_y=None, offset=0):
+        """
+        Draw a single box (each tetromino piece has four boxes)
+        at xy coordinates on the board. Or, if pixel_x & pixel_y
+        are specified, draw to the pixel coordinates stored in
+        pixel_x & pixel_y (this is used for the "Next" piece).
+
+        @param box_x:
+        @param box_y:
+        @param color:
+        @param pixel_x:
+        @param pixel_y:
+        """
+        if color == BLANK:
+            return
+        if pixel_x is None and pixel_y is None:
+            pixel_x, pixel_y = BattleTetro.convert_pixel_to_coordinates(box_x, box_y, offset)
+        self.atlas.blit(self.surface, color, pixel_x, pixel_y)
+
+    def draw_status(self, score, level):
+        """
+        Draw the score text
+
+        @param score:
+        @param level:
+        """
+        score_surface = text_cache.render('Score: %s' % score, self.fonts['basic'], TEXT_COLOR)
+        score_rect = score_surface.get_rect()
+        score_rect.topleft = (WINDOW_WIDTH - 140, 20)
+        self.surface.blit(score_surface, score_rect)
+
+        # Draw the level text
+        level_surface = text_cache.render('Level: %s' % level, self.fonts['basic'], TEXT_COLOR)
+        level_rect = level_surface.get_rect()
+        level_rect.topleft = (WINDOW_WIDTH - 140, 50)
+        self.surface.blit(level_surface, level_rect)
+
+    def draw_piece(self, piece, pixel_x=None, pixel_y=None, offset=0):
+        shape_to_draw = COMPILED_SHAPES[piece['shape']][piece['rotation']]
+        if pixel_x is None and pixel_y is None:
+            # if pixel_x & pixel_y have not been specified, use the location stored in the piece data structure.
+            pixel_x, pixel_y = self.convert_pixel_to_coordinates(piece['x'], piece['y'], offset)
+
+        # Draw each of the blocks that make up the piece
+        for x, y in shape_to_draw.cells:
+            self.draw_box(None, None, piece['color'], pixel_x + (x * BOX_SIZE), pixel_y + (y * BOX_SIZE))
+        for x, y in shape_to_draw.poison_cells:
+            self.draw_box(None, None, POISON, pixel_x + (x * BOX_SIZE), pixel_y + (y * BOX_SIZE))
+
+    def draw_next_piece(self):
+        """
+        Draw the "Next" text.
+        """
+        next_surface = text_cache.render('Next:', self.fonts['basic'], TEXT_COLOR)
+        next_rect = next_surface.get_rect()
+        next_rect.topleft = (WINDOW_WIDTH - 120, 100)
+        self.surface.blit(next_surface, next_rect)
+
+        for key, player in enumerate(self.players[:len(BORDER_COLOR)]):
+            # Draw the "next" piece
+            self.draw_piece(player.next_piece, pixel_x=WINDOW_WIDTH-140, pixel_y=120+(int(key) * 90))
+
+    @staticmethod
+    def convert_pixel_to_coordinates(box_x, box_y, offset=0):
+        """
+        Convert the given xy coordinates of the board to xy
+        coordinates of the location on the screen.
+        """
+        return X_MARGIN + offset + (box_x * BOX_SIZE), TOP_MARGIN + (box_y * BOX_SIZE)
+
+    @staticmethod
+    def make_text_objects(text, font, color):
+        surface = text_cache.render(text, font, color)
+        return surface, surface.get_rect()
+
+
+def grid_boards(value):
+    """
+    Parse the number of boards of --grid.
+    """
+    count = int(value)
+    if not GRID_MIN_BOARDS <= count <= GRID_MAX_BOARDS:
+        raise argparse.ArgumentTypeError('%d to %d boards fit in a grid' % (GRID_MIN_BOARDS, GRID_MAX_BOARDS))
+    return count
+
+
+def main(argv=None):
+    """
+    Start the game, by default a local match:
+
+        python -m battle.game [--bot LEVEL] [--record DIR] [--spectate-port PORT]
+        python -m battle.game --host [--port PORT]
+        python -m battle.game --join ADDRESS [--port PORT]
+        python -m battle.game --replay PATH
+        python -m battle.game --spectate ADDRESS [--port PORT]
+        python -m battle.game --grid BOARDS [--bot LEVEL]
+    """
+    from battle.bot import DIFFICULTIES
+    parser = argparse.ArgumentParser(prog='python -m battle.game')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--host', action='store_true', help='host a 1v1 match over the network')
+    mode.add_argument('--join', metavar='ADDRESS', help='join the 1v1 match hosted at address')
+    mode.add_argument('--replay', metavar='PATH', help='play a recorded game back')
+    mode.add_argument('--spectate', metavar='ADDRESS', help='watch the games broadcast at address')
+    mode.add_argument('--grid', type=grid_boards, metavar='BOARDS',
+                      help='watch that many computer players, %d to %d' % (GRID_MIN_BOARDS, GRID_MAX_BOARDS))
+    parser.add_argument('--port', type=int, default=None, help='port of the network match or of the broadcast watched')
+    parser.add_argument('--bot', choices=sorted(DIFFICULTIES), default=None,
+                        help='play against the computer, or its level in a grid')
+    parser.add_argument('--record', metavar='DIR', default=None, help='record a replay of every game to this directory')
+    parser.add_argument('--spectate-port', type=int, metavar='PORT', default=None,
+                        help='let viewers watch the games on this port')
+    parser.add_argument('--stats', metavar='FILE', default=STATS_FILE, help='append frame time summaries to this file')
+    parser.add_argument('--no-sound', action='store_true')
+    args = parser.parse_args(argv)
+
+    game = BattleTetro(record_dir=args.record, stats_file=args.stats, bot=args.bot, spectate_port=args.spectate_port,
+                       sound=not args.no_sound)
+    if args.host or args.join:
+        game.run_network_game(args.join, args.port)
+        game.show_text_screen('Game Over')
+    elif args.replay:
+        game.run_replay(args.replay)
+        game.show_text_screen('The End')
+    elif args.spectate:
+        game.run_spectator(args.spectate, args.port)
+    elif args.grid:
+        game.run_grid(args.grid, args.bot or 'normal')
+        game.show_text_screen('Game Over')
+    else:
+        game.execute()
+
+
+if __name__ == '__main__':
+    main()
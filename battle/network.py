@@ -0,0 +1,234 @@
+import random
+import struct
+import zlib
+from twisted.internet import protocol, task
+from twisted.protocols.basic import Int16StringReceiver
+from battle import snapshot
+from battle.configs import BOARD_HEIGHT, FPS
+from battle.engine import Engine, MatchClock
+from battle.utils import PieceStream
+
+PORT = 8123
+HELLO = 1  # seed
+STEP = 2  # match time, the garbage taken in and the inputs applied at it
+CHECKSUM = 3  # match time and crc of the snapshot of the sender's own board at it
+RESYNC = 4  # match time and a crc of each row the receiver holds for the sender's board
+CORRECTION = 5  # compressed snapshot state and the snapshot rows that differ from the RESYNC
+
+CHECKSUM_EVERY = FPS  # steps between checksums, about one a second
+ROW_CHECKSUMS = struct.Struct('!%dI' % BOARD_HEIGHT)
+STEP_HEADER = struct.Struct('!BIB')  # kind, ms, garbage attacks
+ATTACK = struct.Struct('!BB')  # lines, hole
+
+checksum = snapshot.state_hash  # everything that has to match on both peers
+
+
+def row_checksums(data):
+    """
+    Return a crc32 of every row of the board in the snapshot data.
+    """
+    rows = range(snapshot.STATE_SIZE, snapshot.SIZE, snapshot.ROW_SIZE)
+    return [zlib.crc32(data[offset:offset + snapshot.ROW_SIZE]) & 0xffffffff for offset in rows]
+
+
+class Match(object):
+    """
+    Both boards of a 1v1 match on one machine. The local engine is stepped
+    by tick and every step goes over the wire as its match time plus the
+    inputs applied at it (a few bytes). The remote engine is a replica that
+    is stepped with exactly the same times and inputs from the peer's STEP
+    messages, so it follows the peer's board with no board data sent. Every
+    CHECKSUM_EVERY steps each side sends a crc of its own board; a replica
+    that disagrees sends back a crc per row of its snapshot and receives the
+    state part of the peer's snapshot (piece, score, timers, garbage) and
+    only the rows that differ.
+
+    Garbage needs no messages of its own either. The attacks of the
+    replica are the ones the peer makes at the local player; they are taken
+    in just before the next local step, and that STEP tells the peer about
+    them so its replica of the local board takes them in at the same step.
+    The attacks of the local engine are left to the peer's replica of it.
+    """
+    local = None
+    remote = None
+    steps = 0
+    corrections = 0
+
+    def __init__(self, seed, send, local=None):
+        """
+        @param seed: piece seed shared by both peers
+        @param send: callable taking one encoded message
+        @param local: engine for the local player, a headless one by default
+        """
+        self.seed = seed
+        self.send = send
+        self.clock = MatchClock()
+        self.remote_clock = MatchClock()
+        # The same seed makes the same pieces on both machines.
+        pieces = PieceStream(seed, readers=2)
+        if local is None:
+            local = Engine(0.0, self.clock, pieces.reader())
+        else:
+            local.clock = self.clock
+            local.get_piece = pieces.reader()
+            local.now = 0.0
+            local.reset_timers(0.0)
+            local.deal()
+        self.local = local
+        self.remote = Engine(0.0, self.remote_clock, pieces.reader())
+        self.incoming = []  # (lines, hole) attacks on the local player, taken in at the next tick
+
+    def tick(self, ms, inputs=()):
+        """
+        Step the local engine to match time ms with the (action, pressed)
+        inputs and tell the peer about it.
+
+        @param ms: milliseconds since the start of the match
+        @param inputs:
+        """
+        self.clock.ms = ms
+        incoming = self.incoming[:255]
+        del self.incoming[:len(incoming)]
+        for lines, hole in incoming:
+            self.local.receive_garbage(lines, hole)
+        self.local.step(inputs)
+        del self.local.attacks[:]  # the peer's replica makes them for itself
+        self.send(STEP_HEADER.pack(STEP, ms, len(incoming)) +
+                  b''.join(ATTACK.pack(lines, hole) for lines, hole in incoming) +
+                  bytearray(action << 1 | bool(pressed) for action, pressed in inputs))
+        self.steps += 1
+        if self.steps % CHECKSUM_EVERY == 0:
+            self.send(struct.pack('!BII', CHECKSUM, ms, checksum(self.local)))
+        return self.local.game_over
+
+    def message_received(self, data):
+        kind = struct.unpack_from('!B', data)[0]
+        if kind == STEP:
+            _, ms, attacks = STEP_HEADER.unpack_from(data)
+            offset = STEP_HEADER.size
+            for _ in range(attacks):
+                self.remote.receive_garbage(*ATTACK.unpack_from(data, offset))
+                offset += ATTACK.size
+            self.remote_clock.ms = ms
+            self.remote.step([(code >> 1, bool(code & 1)) for code in bytearray(data[offset:])])
+            self.incoming.extend(self.remote.attacks)
+            del self.remote.attacks[:]
+        elif kind == CHECKSUM:
+            ms, crc = struct.unpack_from('!II', data, 1)
+            # TCP keeps the order, the replica has already been stepped to ms.
+            if checksum(self.remote) != crc:
+                rows = row_checksums(snapshot.encode(self.remote))
+                self.send(struct.pack('!BI', RESYNC, ms) + ROW_CHECKSUMS.pack(*rows))
+        elif kind == RESYNC:
+            self.send_correction(ROW_CHECKSUMS.unpack_from(data, 5))
+        elif kind == CORRECTION:
+            self.apply_correction(zlib.decompress(data[1:]))
+
+    def send_correction(self, checksums):
+        """
+        Send the snapshot of the local engine at the last STEP sent, all
+        but the rows whose crc the peer has right.
+        """
+        data = snapshot.encode(self.local)
+        payload = bytearray(data[:snapshot.STATE_SIZE])
+        for y, (theirs, ours) in enumerate(zip(checksums, row_checksums(data))):
+            if theirs != ours:
+                offset = snapshot.STATE_SIZE + y * snapshot.ROW_SIZE
+                payload += struct.pack('!B', y) + data[offset:offset + snapshot.ROW_SIZE]
+        self.send(struct.pack('!B', CORRECTION) + zlib.compress(bytes(payload)))
+
+    def apply_correction(self, payload):
+        """
+        Bring the replica in line with a CORRECTION: its own snapshot with
+        the state and rows received written over it is decoded back into it.
+        It is applied straight away as the peer sent it right after the STEP
+        the replica is at.
+        """
+        data = snapshot.encode(self.remote)
+        data[:snapshot.STATE_SIZE] = payload[:snapshot.STATE_SIZE]
+        for offset in range(snapshot.STATE_SIZE, len(payload), 1 + snapshot.ROW_SIZE):
+            row = snapshot.STATE_SIZE + payload[offset] * snapshot.ROW_SIZE
+            data[row:row + snapshot.ROW_SIZE] = payload[offset + 1:offset + 1 + snapshot.ROW_SIZE]
+        snapshot.decode(data, self.remote)
+        self.corrections += 1
+
+
+class MatchProtocol(Int16StringReceiver):
+    """
+    Carries a Match between two machines. The hosting side picks the seed
+    and sends it in HELLO, then both sides start their match clocks.
+    """
+    match = None
+
+    def connectionMade(self):
+        if self.factory.hosting:
+            seed = self.factory.seed
+            if seed is None:
+                seed = random.getrandbits(32)
+            self.sendString(struct.pack('!BI', HELLO, seed))
+            self.start(seed)
+
+    def start(self, seed):
+        self.match = Match(seed, self.sendString, self.factory.local)
+        self.factory.match_started(self.match)
+
+    def stringReceived(self, data):
+        if struct.unpack_from('!B', data)[0] == HELLO:
+            self.start(struct.unpack_from('!I', data, 1)[0])
+        elif self.match is not None:
+            self.match.message_received(data)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.factory.match_ended(self.match)
+
+
+class MatchFactory(protocol.ClientFactory):
+    """
+    Factory for both ends of a match: listen with hosting=True, connect
+    with hosting=False. on_start and on_end are called with the Match.
+    """
+    protocol = MatchProtocol
+
+    def __init__(self, hosting=True, seed=None, local=None, on_start=None, on_end=None):
+        self.hosting = hosting
+        self.seed = seed
+        self.local = local
+        self.on_start = on_start
+        self.on_end = on_end
+
+    def match_started(self, match):
+        if self.on_start is not None:
+            self.on_start(match)
+
+    def match_ended(self, match):
+        if self.on_end is not None:
+            self.on_end(match)
+
+
+class HeadlessPeer(object):
+    """
+    Plays the local side of a match with no window, FPS steps a second.
+    policy(engine) returns the inputs for the next step; it plays nothing
+    by default. Handy to test matches over loopback.
+    """
+    match = None
+    loop = None
+
+    def __init__(self, policy=None, fps=FPS):
+        self.policy = policy or (lambda engine: ())
+        self.fps = fps
+        self.ms = 0
+
+    def start(self, match):
+        self.match = match
+        self.loop = task.LoopingCall(self.tick)
+        self.loop.start(1.0 / self.fps)
+
+    def tick(self):
+        self.ms += int(1000 / self.fps)
+        if self.match.tick(self.ms, self.policy(self.match.local)):
+            self.stop()
+
+    def stop(self, match=None):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
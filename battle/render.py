@@ -0,0 +1,333 @@
+import math
+import pygame
+from collections import OrderedDict
+from battle import BG_COLOR, COLORS, LIGHT_COLORS, POISON_COLOR, LIGHT_POISON_COLOR
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, BOX_SIZE, BLANK, POISON, X_MARGIN, TOP_MARGIN
+from battle.shapes import COMPILED_SHAPES
+
+HIDDEN_ROWS = 2  # pieces start above the board, keep room to show them
+BORDER = 5
+
+
+def draw_box(surface, color, pixel_x, pixel_y):
+    """
+    Draw a single box with its top left corner at the pixel coordinates.
+
+    @param surface:
+    @param color:
+    @param pixel_x:
+    @param pixel_y:
+    """
+    if color == BLANK:
+        return
+    if color == POISON:
+        dark, light = POISON_COLOR, LIGHT_POISON_COLOR
+    else:
+        dark, light = COLORS[color], LIGHT_COLORS[color]
+    pygame.draw.rect(surface, dark, (pixel_x + 1, pixel_y + 1, BOX_SIZE - 1, BOX_SIZE - 1))
+    pygame.draw.rect(surface, light, (pixel_x + 1, pixel_y + 1, BOX_SIZE - 4, BOX_SIZE - 4))
+
+
+def ghost(color):
+    """
+    Return the tile color of a ghost box of color: where the falling piece
+    would land, drawn as an outline.
+    """
+    return -1 - color
+
+
+class TileAtlas(object):
+    """
+    One pre-rendered tile per color index, drawn once at startup, so a box
+    is a single blit instead of two rect fills. The blank tile follows the
+    colors, then a ghost tile per color and last the poison tile. Tiles are opaque with the
+    background color around the box; keyed tiles leave the background
+    transparent for boxes drawn over something else (e.g. the border).
+    """
+    surface = None
+    keyed = None
+
+    def __init__(self):
+        self.surface = pygame.Surface(((2 * len(COLORS) + 2) * BOX_SIZE, BOX_SIZE))
+        self.surface.fill(BG_COLOR)
+        for color in range(len(COLORS)):
+            draw_box(self.surface, color, color * BOX_SIZE, 0)
+            pygame.draw.rect(self.surface, LIGHT_COLORS[color],
+                             ((len(COLORS) + 1 + color) * BOX_SIZE + 1, 1, BOX_SIZE - 1, BOX_SIZE - 1), 1)
+        draw_box(self.surface, POISON, (2 * len(COLORS) + 1) * BOX_SIZE, 0)
+        self.keyed = self.surface.copy()
+        self.keyed.set_colorkey(BG_COLOR)
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert()
+            self.keyed = self.keyed.convert()
+
+    @staticmethod
+    def area(color):
+        """
+        Return the rect of the tile for color (BLANK is a background tile).
+        """
+        if color == BLANK:
+            index = len(COLORS)
+        elif color == POISON:
+            index = 2 * len(COLORS) + 1
+        elif color < 0:
+            index = len(COLORS) - color  # ghost
+        else:
+            index = color
+        return pygame.Rect(index * BOX_SIZE, 0, BOX_SIZE, BOX_SIZE)
+
+    def blit(self, surface, color, pixel_x, pixel_y):
+        """
+        Draw the box for color over whatever is at the pixel coordinates.
+        """
+        if color != BLANK:
+            surface.blit(self.keyed, (pixel_x, pixel_y), self.area(color))
+
+
+class TextCache(object):
+    """
+    Keeps the last rendered text surfaces keyed on (text, font, color)
+    and drops the least recently used once more than size are held.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.surfaces = OrderedDict()
+
+    def render(self, text, font, color):
+        key = (text, font, color)
+        surface = self.surfaces.pop(key, None)
+        if surface is None:
+            surface = font.render(text, True, color)
+            if len(self.surfaces) >= self.size:
+                self.surfaces.popitem(last=False)
+        self.surfaces[key] = surface
+        return surface
+
+
+text_cache = TextCache()
+
+FONT_NAME = 'freesansbold.ttf'
+FONT_SIZES = dict(basic=18, big=100, small=11)
+
+
+class Fonts(object):
+    """
+    The fonts of the window by name, each one loaded (and pygame's font
+    module started) the first time it is used.
+    """
+
+    def __init__(self, sizes=FONT_SIZES, name=FONT_NAME):
+        self.sizes = sizes
+        self.name = name
+        self.loaded = dict()
+
+    def __getitem__(self, key):
+        font = self.loaded.get(key)
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = self.loaded[key] = pygame.font.Font(self.name, self.sizes[key])
+        return font
+
+
+class BoardRenderer(object):
+    """
+    Keeps a persistent surface with one board, its border and the falling
+    piece. draw only repaints the boxes that changed since the last frame
+    and returns the screen rect that needs to be pushed to the display.
+    The whole board is only compared when the board itself changed (a
+    piece locked or lines were removed), otherwise just the boxes of the
+    old and new falling piece are. The ghost of the piece is projected
+    from the board's skyline, so it costs no collision checks.
+    """
+    rect = None
+    surface = None
+    background = None
+    shown = None
+    overlay = None
+    version = None
+    piece_key = None
+
+    def __init__(self, offset=0, border_color=None, atlas=None, show_ghost=True):
+        self.atlas = atlas or TileAtlas()
+        self.show_ghost = show_ghost
+        left = X_MARGIN + offset - 3
+        top = TOP_MARGIN - HIDDEN_ROWS * BOX_SIZE
+        self.rect = pygame.Rect(left, top, BOARD_WIDTH * BOX_SIZE + 8, (HIDDEN_ROWS + BOARD_HEIGHT) * BOX_SIZE + 1)
+        # Pixel position of box (0, 0) on the board surface
+        self.origin = (X_MARGIN + offset - left, TOP_MARGIN - top)
+
+        self.background = pygame.Surface(self.rect.size)
+        self.background.fill(BG_COLOR)
+        if border_color is not None:
+            pygame.draw.rect(self.background, border_color, (0, self.origin[1] - 7, self.rect.width,
+                                                             BOARD_HEIGHT * BOX_SIZE + 8), BORDER)
+            self.background.fill(BG_COLOR, (self.origin[0], self.origin[1], BOARD_WIDTH * BOX_SIZE,
+                                            BOARD_HEIGHT * BOX_SIZE))
+        self.surface = pygame.Surface(self.rect.size)
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forget what is on the board surface so the next draw repaints it all.
+        """
+        self.surface.blit(self.background, (0, 0))
+        self.shown = [[BLANK] * BOARD_WIDTH for _ in range(HIDDEN_ROWS + BOARD_HEIGHT)]
+        self.overlay = dict()
+        self.version = None
+        self.piece_key = None
+
+    def box_rect(self, x, y):
+        return pygame.Rect(self.origin[0] + x * BOX_SIZE, self.origin[1] + y * BOX_SIZE, BOX_SIZE, BOX_SIZE)
+
+    def piece_boxes(self, piece, board=None):
+        """
+        Return {(x, y): color} for the boxes of piece that fit on the surface
+        along with its ghost when a board is given.
+        """
+        boxes = dict()
+        if piece is None:
+            return boxes
+        shape = COMPILED_SHAPES[piece['shape']][piece['rotation']]
+        cells = [(dx, dy, piece['color']) for dx, dy in shape.cells]
+        cells.extend((dx, dy, POISON) for dx, dy in shape.poison_cells)
+        if board is not None:
+            landing = piece['y'] + board.drop_distance(piece)
+            for dx, dy, color in cells:
+                x = piece['x'] + dx
+                y = landing + dy
+                if 0 <= x < BOARD_WIDTH and -HIDDEN_ROWS <= y < BOARD_HEIGHT:
+                    boxes[(x, y)] = ghost(piece['color'])
+        for dx, dy, color in cells:
+            x = piece['x'] + dx
+            y = piece['y'] + dy
+            if 0 <= x < BOARD_WIDTH and -HIDDEN_ROWS <= y < BOARD_HEIGHT:
+                boxes[(x, y)] = color
+        return boxes
+
+    def draw(self, target, board, piece=None):
+        """
+        Bring the board surface up to date, copy the changed part to
+        target and return the list of dirty screen rects.
+
+        @param target:
+        @param board:
+        @param piece:
+        """
+        piece_key = None if piece is None else (piece['shape'], piece['rotation'], piece['x'], piece['y'], piece['color'])
+        if board.version == self.version and piece_key == self.piece_key:
+            return []  # most frames, the piece only moves every few of them
+        self.piece_key = piece_key
+        overlay = self.piece_boxes(piece, board if self.show_ghost else None)
+        if board.version != self.version:
+            check = [(x, y) for y in range(-HIDDEN_ROWS, BOARD_HEIGHT) for x in range(BOARD_WIDTH)]
+        else:
+            check = set(self.overlay)
+            check.update(overlay)
+
+        dirty = None
+        blits = []
+        atlas = self.atlas
+        for x, y in check:
+            if (x, y) in overlay:
+                color = overlay[(x, y)]
+            elif y >= 0:
+                color = board.colors[y][x]
+            else:
+                color = BLANK
+            if self.shown[y + HIDDEN_ROWS][x] == color:
+                continue
+            self.shown[y + HIDDEN_ROWS][x] = color
+            box = self.box_rect(x, y)
+            if y >= 0:
+                blits.append((atlas.surface, box, atlas.area(color)))
+            else:
+                # Above the board the border shows around the box
+                blits.append((self.background, box, box))
+                if color != BLANK:
+                    blits.append((atlas.keyed, box, atlas.area(color)))
+            dirty = box if dirty is None else dirty.union(box)
+        if blits:
+            self.surface.blits(blits, False)
+
+        self.overlay = overlay
+        self.version = board.version
+        if dirty is None:
+            return []
+        target.blit(self.surface, dirty.move(self.rect.topleft), dirty)
+        return [dirty.move(self.rect.topleft)]
+
+    def draw_all(self, target):
+        """
+        Copy the whole board surface to target and return its rect.
+        """
+        target.blit(self.surface, self.rect)
+        return [self.rect]
+
+
+class GridView(object):
+    """
+    Shows many boards at once, e.g. to follow a tournament. Every board has
+    a BoardRenderer of its own drawing at BOX_SIZE on one canvas, so only
+    the boards that changed are repainted, and the canvas is then scaled
+    to fit rect in a single pygame.transform pass, only on frames where a
+    board changed. The plain scale only reads the pixels it writes, so its
+    cost stays the same however many boards there are; smoothscale reads
+    the whole canvas.
+    """
+    canvas = None
+    rect = None
+
+    def __init__(self, count, rect, atlas=None, border_colors=(None,), columns=None, gap=BOX_SIZE, smooth=False):
+        """
+        @param count: number of boards
+        @param rect: screen area to fit the boards in, keeping their shape
+        @param atlas: TileAtlas shared by the boards
+        @param border_colors: border colors the boards take in turn
+        @param columns: boards a row, by default the number that shows them biggest
+        @param gap: pixels between two boards before scaling
+        @param smooth: scale with smoothscale, nicer but slower with more boards
+        """
+        self.scale = pygame.transform.smoothscale if smooth else pygame.transform.scale
+        atlas = atlas or TileAtlas()
+        width = BOARD_WIDTH * BOX_SIZE + 8  # the size of a BoardRenderer
+        height = (HIDDEN_ROWS + BOARD_HEIGHT) * BOX_SIZE + 1
+
+        def fit(columns):
+            rows = int(math.ceil(count / float(columns)))
+            return min(rect.width / float(gap + columns * (width + gap)), rect.height / float(gap + rows * (height + gap)))
+
+        columns = columns or max(range(1, count + 1), key=fit)
+        rows = int(math.ceil(count / float(columns)))
+        self.renderers = []
+        for i in range(count):
+            renderer = BoardRenderer(0, border_colors[i % len(border_colors)], atlas, show_ghost=False)
+            renderer.rect.topleft = (gap + i % columns * (width + gap), gap + i // columns * (height + gap))
+            self.renderers.append(renderer)
+        self.canvas = pygame.Surface((gap + columns * (width + gap), gap + rows * (height + gap)))
+        if pygame.display.get_surface() is not None:
+            self.canvas = self.canvas.convert()
+        self.canvas.fill(BG_COLOR)
+        for renderer in self.renderers:
+            renderer.draw_all(self.canvas)
+        self.rect = pygame.Rect(0, 0, int(self.canvas.get_width() * fit(columns)),
+                                int(self.canvas.get_height() * fit(columns)))
+        self.rect.center = rect.center
+        self.scaled = pygame.Surface(self.rect.size, 0, self.canvas)
+
+    def draw(self, target, players, force=False):
+        """
+        Bring the boards of players (anything with a board and a
+        falling_piece) up to date on target and return the dirty rects.
+        """
+        changed = force
+        for renderer, player in zip(self.renderers, players):
+            if renderer.draw(self.canvas, player.board, player.falling_piece):
+                changed = True
+        if not changed:
+            return []
+        self.scale(self.canvas, self.rect.size, self.scaled)
+        target.blit(self.scaled, self.rect)
+        return [self.rect]
+
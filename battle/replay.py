@@ -0,0 +1,114 @@
+import io
+import struct
+from battle.engine import Engine, MatchClock, exchange_garbage
+from battle.utils import PieceStream
+
+MAGIC = b'BTR3'  # games since poison pieces, older ones play out differently
+HEADER = struct.Struct('!4sIB')  # magic, piece seed, number of players
+STEP = 0x00  # followed by the ms since the previous step as a varint
+EVENT = 0x80  # | player << 4 | action << 1 | pressed
+BUFFER_SIZE = 64 * 1024
+
+
+class ReplayWriter(object):
+    """
+    Streams a match to a compact binary log: the piece seed, then for every
+    step the (player, action, pressed) inputs applied at it, one byte each,
+    followed by the step's time as a varint delta in milliseconds. Writes
+    go through a large buffer so recording costs no disk access per frame.
+    """
+    last_ms = 0
+
+    def __init__(self, path_or_file, seed, players):
+        if isinstance(path_or_file, str):
+            self.file = io.open(path_or_file, 'wb', buffering=BUFFER_SIZE)
+        else:
+            self.file = path_or_file
+        self.file.write(HEADER.pack(MAGIC, seed, players))
+
+    def event(self, player, action, pressed):
+        self.file.write(struct.pack('!B', EVENT | player << 4 | action << 1 | bool(pressed)))
+
+    def step(self, ms):
+        """
+        Close the inputs of a step applied at match time ms.
+        """
+        delta = ms - self.last_ms
+        self.last_ms = ms
+        data = bytearray([STEP])
+        while True:
+            byte = delta & 0x7f
+            delta >>= 7
+            if delta:
+                data.append(byte | 0x80)
+            else:
+                data.append(byte)
+                break
+        self.file.write(bytes(data))
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayReader(object):
+    """
+    Reads a log written by ReplayWriter.
+    """
+
+    def __init__(self, path_or_file):
+        if isinstance(path_or_file, str):
+            path_or_file = io.open(path_or_file, 'rb', buffering=BUFFER_SIZE)
+        self.file = path_or_file
+        magic, self.seed, self.players = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('not a replay file')
+
+    def steps(self):
+        """
+        Yield (ms, inputs) for every step, inputs holding one list of
+        (action, pressed) per player.
+        """
+        data = bytearray(self.file.read())
+        inputs = [list() for _ in range(self.players)]
+        ms = 0
+        offset = 0
+        while offset < len(data):
+            code = data[offset]
+            offset += 1
+            if code & EVENT:
+                inputs[(code >> 4) & 0x07].append(((code >> 1) & 0x07, bool(code & 1)))
+                continue
+            delta = shift = 0
+            while True:
+                byte = data[offset]
+                offset += 1
+                delta |= (byte & 0x7f) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            ms += delta
+            yield ms, inputs
+            inputs = [list() for _ in range(self.players)]
+
+    def close(self):
+        self.file.close()
+
+
+def play(path_or_file, engine_class=Engine):
+    """
+    Replay a log headless as fast as possible and return the engines.
+
+    @param path_or_file:
+    @param engine_class: Engine or a subclass taking the same arguments
+    """
+    replay = ReplayReader(path_or_file)
+    clock = MatchClock()
+    pieces = PieceStream(replay.seed, readers=replay.players)
+    engines = [engine_class(0.0, clock, pieces.reader()) for _ in range(replay.players)]
+    for ms, inputs in replay.steps():
+        clock.ms = ms
+        for engine, player_inputs in zip(engines, inputs):
+            engine.step(player_inputs)
+        exchange_garbage(engines)
+    replay.close()
+    return engines
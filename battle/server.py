@@ -0,0 +1,349 @@
+"""
+Hosts many headless matches in one process for online ladders:
+
+    python -m battle.server [--port PORT] [--players N]
+
+Every match is an asyncio task of its own with its own engines, pieces and
+match clock, stepped on its own tick schedule from the inputs its clients
+queued since the last tick. Clients only send inputs; every tick the server
+sends them all the inputs it applied so they step replicas of every board,
+as in battle.network, with a checksum of each board now and again.
+Messages are framed like Int16StringReceiver (a two byte length first).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import struct
+import time
+from collections import deque
+from battle.configs import FPS
+from battle.engine import Engine, MatchClock, exchange_garbage
+from battle.network import HELLO, STEP, CHECKSUM, CHECKSUM_EVERY, checksum
+from battle.stats import percentiles
+from battle.utils import PieceStream
+
+PORT = 8124
+INPUT = 6  # client inputs for the next tick, one byte each
+END = 7  # match time and the final scores
+FRAME = struct.Struct('!H')
+INPUT_QUEUE = FPS  # input messages a client may be ahead by before its socket stops being read
+MAX_INPUTS = 255  # inputs of one client applied in a tick, its count is sent in one byte
+OUTBOX = 4 * FPS  # messages a client may fall behind by before it is dropped
+LATENCY_WINDOW = 10000  # ticks the latency percentiles are taken over
+
+log = logging.getLogger(__name__)
+
+
+def frame(data):
+    return FRAME.pack(len(data)) + data
+
+
+async def read_message(reader):
+    """
+    Return the next message from reader, None once the connection closed.
+    """
+    try:
+        size = FRAME.unpack(await reader.readexactly(FRAME.size))[0]
+        return await reader.readexactly(size)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class Client(object):
+    """
+    One connection to a match. Inputs go into a bounded queue: when it is
+    full the reader waits, the socket is not read and TCP pushes back on
+    the client. Messages to the client go through a bounded outbox that a
+    task of its own writes out; a client that lets it fill up is too slow
+    to follow the match and is dropped rather than holding the match up.
+    """
+    connected = True
+    closed = False
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.inputs = asyncio.Queue(INPUT_QUEUE)
+        self.held = []  # inputs over MAX_INPUTS, applied on the next ticks
+        self.outbox = asyncio.Queue(OUTBOX)
+        self.sender = None
+
+    def start(self):
+        self.sender = asyncio.ensure_future(self.send_all())
+
+    def send(self, data):
+        if self.closed or not self.connected:
+            return
+        try:
+            self.outbox.put_nowait(data)
+        except asyncio.QueueFull:
+            self.close()
+
+    async def send_all(self):
+        try:
+            while True:
+                data = await self.outbox.get()
+                if data is None:
+                    break
+                self.writer.write(frame(data))
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.connected = False
+        self.writer.close()
+
+    async def read_all(self):
+        while True:
+            data = await read_message(self.reader)
+            if data is None:
+                break
+            if data[:1] == bytes([INPUT]):
+                await self.inputs.put(bytearray(data[1:]))
+        self.connected = False
+
+    def take_inputs(self):
+        """
+        Return the (action, pressed) inputs queued since the last tick, at
+        most MAX_INPUTS of them; the rest wait for the next ticks.
+        """
+        inputs = self.held
+        while len(inputs) < MAX_INPUTS and not self.inputs.empty():
+            inputs.extend((code >> 1, bool(code & 1)) for code in self.inputs.get_nowait())
+        self.held = inputs[MAX_INPUTS:]
+        return inputs[:MAX_INPUTS]
+
+    def close(self):
+        """
+        Send what is queued and hang up.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.sender is None:
+            self.writer.close()  # never started, nothing to send
+            return
+        try:
+            self.outbox.put_nowait(None)
+        except asyncio.QueueFull:
+            self.sender.cancel()
+            self.writer.close()
+
+
+class ServerMatch(object):
+    """
+    A match between clients, sharing nothing with the other matches of the
+    server. run steps it tick_rate times a second of match time until every
+    board is over or every client gone; when a tick is late the following
+    ones catch up so match time stays exact.
+    """
+    ticks = 0
+
+    def __init__(self, server, clients, seed=None, tick_rate=FPS):
+        self.server = server
+        self.clients = clients
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.tick_rate = tick_rate
+        self.clock = MatchClock()
+        pieces = PieceStream(self.seed, readers=len(clients))
+        self.engines = [Engine(0.0, self.clock, pieces.reader()) for _ in clients]
+
+    def tick(self):
+        """
+        Step every engine with the inputs its client queued and tell every
+        client about it. Return True once the match is over.
+        """
+        self.ticks += 1
+        self.clock.ms = self.ticks * 1000 // self.tick_rate
+        message = bytearray(struct.pack('!BI', STEP, self.clock.ms))
+        over = True
+        for client, engine in zip(self.clients, self.engines):
+            inputs = client.take_inputs()
+            over = engine.step(inputs) and over
+            message += struct.pack('!B', len(inputs)) + bytearray(action << 1 | pressed for action, pressed in inputs)
+        exchange_garbage(self.engines)
+        message = bytes(message)
+        for client in self.clients:
+            client.send(message)
+        if self.ticks % CHECKSUM_EVERY == 0:
+            message = struct.pack('!BI', CHECKSUM, self.clock.ms) + b''.join(
+                struct.pack('!I', checksum(engine)) for engine in self.engines)
+            for client in self.clients:
+                client.send(message)
+        return over or not any(client.connected for client in self.clients)
+
+    async def run(self):
+        """
+        Play the match out. The clients are hung up on however it ends; if
+        it fails, the error is logged and they get no END.
+        """
+        try:
+            for i, client in enumerate(self.clients):
+                client.start()
+                client.send(struct.pack('!BIBB', HELLO, self.seed, i, len(self.clients)))
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            while True:
+                due = start + (self.ticks + 1) / float(self.tick_rate)
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                late = loop.time() - due
+                began = time.perf_counter()
+                over = self.tick()
+                self.server.ticked(late, time.perf_counter() - began)
+                if over:
+                    break
+            message = struct.pack('!BI', END, self.clock.ms) + b''.join(
+                struct.pack('!I', engine.score) for engine in self.engines)
+            for client in self.clients:
+                client.send(message)
+        except Exception:
+            log.exception('match %d failed at %d ms', self.seed, self.clock.ms)
+        finally:
+            for client in self.clients:
+                client.close()
+
+
+class MatchServer(object):
+    """
+    Pairs clients up as they connect, players_per_match at a time, and
+    runs a ServerMatch task for every group. Everything runs on one event
+    loop, so one process uses one core; run a server per core and the
+    metrics tell how many matches a core keeps up with.
+    """
+    server = None
+    started = 0
+    finished = 0
+    busy = 0.0
+
+    def __init__(self, host='', port=PORT, players_per_match=2, tick_rate=FPS):
+        self.host = host
+        self.port = port
+        self.players_per_match = players_per_match
+        self.tick_rate = tick_rate
+        self.waiting = []
+        self.matches = set()
+        self.latency = deque(maxlen=LATENCY_WINDOW)
+        self.step_time = deque(maxlen=LATENCY_WINDOW)
+        self.since = time.perf_counter()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.connected, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self, report_every=10.0):
+        await self.start()
+        while True:
+            await asyncio.sleep(report_every)
+            log.info('metrics %s', self.metrics())
+
+    async def connected(self, reader, writer):
+        client = Client(reader, writer)
+        self.waiting.append(client)
+        if len(self.waiting) >= self.players_per_match:
+            clients = self.waiting[:self.players_per_match]
+            del self.waiting[:self.players_per_match]
+            self.start_match(clients)
+        await client.read_all()
+        if client in self.waiting:
+            self.waiting.remove(client)
+            writer.close()
+
+    def start_match(self, clients, seed=None):
+        match = ServerMatch(self, clients, seed, self.tick_rate)
+        task = asyncio.ensure_future(match.run())
+        self.matches.add(task)
+        self.started += 1
+        task.add_done_callback(self.match_done)
+        return task
+
+    def match_done(self, task):
+        self.matches.discard(task)
+        self.finished += 1
+
+    def ticked(self, late, spent):
+        self.latency.append(late * 1000)
+        self.step_time.append(spent * 1000)
+        self.busy += spent
+
+    def metrics(self):
+        """
+        Return the running and finished matches, how late ticks start and
+        how long they take (p50/p95/p99 ms), the share of time the process
+        spent stepping matches since the last call and, from the mean tick
+        time, how many matches one core would keep up with.
+        """
+        now = time.perf_counter()
+        busy = self.busy / max(now - self.since, 1e-9)
+        self.busy = 0.0
+        self.since = now
+        mean = sum(self.step_time) / len(self.step_time) if self.step_time else 0.0
+        return dict(
+            running=len(self.matches), started=self.started, finished=self.finished, waiting=len(self.waiting),
+            tick_latency=[round(value, 3) for value in percentiles(self.latency)],
+            tick_time=[round(value, 3) for value in percentiles(self.step_time)],
+            busy=round(busy, 4), matches_per_core=int(1000.0 / (mean * self.tick_rate)) if mean else None,
+            cores=os.cpu_count())
+
+
+async def play_client(host='localhost', port=PORT, policy=None):
+    """
+    Play one match on a MatchServer with no window and return the final
+    scores. policy(engine) returns the inputs to send after each tick, for
+    the engine replicating this client's board; it plays nothing by default.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    engines = None
+    clock = MatchClock()
+    scores = None
+    while True:
+        data = await read_message(reader)
+        if data is None:
+            break
+        kind = data[0]
+        if kind == HELLO:
+            seed, index, players = struct.unpack_from('!IBB', data, 1)
+            pieces = PieceStream(seed, readers=players)
+            engines = [Engine(0.0, clock, pieces.reader()) for _ in range(players)]
+        elif kind == STEP:
+            clock.ms = struct.unpack_from('!I', data, 1)[0]
+            offset = 5
+            for engine in engines:
+                count = data[offset]
+                engine.step([(code >> 1, bool(code & 1)) for code in data[offset + 1:offset + 1 + count]])
+                offset += 1 + count
+            exchange_garbage(engines)
+            if policy is not None:
+                inputs = policy(engines[index])
+                if inputs:
+                    writer.write(frame(bytes([INPUT]) + bytes(action << 1 | pressed for action, pressed in inputs)))
+        elif kind == CHECKSUM:
+            ms = struct.unpack_from('!I', data, 1)[0]
+            theirs = struct.unpack_from('!%dI' % len(engines), data, 5)
+            if list(theirs) != [checksum(engine) for engine in engines]:
+                raise ValueError('boards out of sync at %d ms' % ms)
+        elif kind == END:
+            scores = list(struct.unpack_from('!%dI' % len(engines), data, 5))
+            break
+    writer.close()
+    return scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m battle.server')
+    parser.add_argument('--host', default='')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--players', type=int, default=2, help='players per match')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    server = MatchServer(args.host, args.port, args.players)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
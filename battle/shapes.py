@@ -0,0 +1,46 @@
+from collections import namedtuple
+from battle.configs import BLANK, POISON, TEMPLATE_WIDTH, TEMPLATE_HEIGHT
+from battle.templates import SHAPES, POISONS
+
+# One rotation of a shape, compiled from its template.
+#   cells:        (x, y) offsets of the solid boxes
+#   poison_cells: (x, y) offsets of the poison boxes
+#   bounds:       (min_x, min_y, max_x, max_y) of the solid and poison boxes
+#   rotations:    how many rotations the shape has
+CompiledShape = namedtuple('CompiledShape', 'cells poison_cells bounds rotations')
+
+
+def compile_template(template, rotations):
+    """
+    Compile one rotation of a template. Templates are indexed [x][y].
+
+    @param template:
+    @param rotations:
+    """
+    cells = []
+    poison_cells = []
+    for x in range(TEMPLATE_WIDTH):
+        for y in range(TEMPLATE_HEIGHT):
+            if template[x][y] == POISON:
+                poison_cells.append((x, y))
+            elif template[x][y] != BLANK:
+                cells.append((x, y))
+    every = cells + poison_cells
+    xs = [x for x, _ in every]
+    ys = [y for _, y in every]
+    return CompiledShape(tuple(cells), tuple(poison_cells), (min(xs), min(ys), max(xs), max(ys)), rotations)
+
+
+def compile_shapes(*template_sets):
+    """
+    Return a dict mapping every shape name to a tuple with one
+    CompiledShape per rotation.
+    """
+    table = dict()
+    for templates in template_sets:
+        for name, rotations in templates.items():
+            table[name] = tuple(compile_template(template, len(rotations)) for template in rotations)
+    return table
+
+
+COMPILED_SHAPES = compile_shapes(SHAPES, POISONS)
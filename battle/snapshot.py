@@ -0,0 +1,123 @@
+import struct
+import zlib
+from battle import COLORS
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, BLANK, POISON
+from battle.shapes import COMPILED_SHAPES
+
+# A snapshot is a fixed size block: a header with the player's state, the
+# falling and next pieces, the garbage on its way in and then the board at
+# 4 bits a box, two boxes a byte, the left box in the high nibble.
+VERSION = 2
+HEADER = struct.Struct('!BdIIHHHd3dB')  # version, now, score, turn, level, lines, bonus lines, bangs, 3 timers, flags
+PIECE = struct.Struct('!BBbbB')  # shape, rotation, x, y, color
+GARBAGE = struct.Struct('!B%ds' % BOARD_HEIGHT)  # lines, the hole of each
+ROW_SIZE = BOARD_WIDTH // 2
+BOARD_SIZE = ROW_SIZE * BOARD_HEIGHT
+STATE_SIZE = HEADER.size + 2 * PIECE.size + GARBAGE.size  # everything before the board
+SIZE = STATE_SIZE + BOARD_SIZE
+
+SHAPE_NAMES = tuple(sorted(COMPILED_SHAPES))
+NO_PIECE = 255
+POISON_CODE = 15
+assert len(COLORS) < POISON_CODE and BOARD_WIDTH % 2 == 0
+
+# Box code of every board color and back, BLANK being 0
+CODES = dict((color, color + 1) for color in range(len(COLORS)))
+CODES[BLANK] = 0
+CODES[POISON] = POISON_CODE
+CELLS = dict((code, color) for color, code in CODES.items())
+# Both boxes of every byte
+PAIRS = tuple((CELLS.get(byte >> 4, BLANK), CELLS.get(byte & 15, BLANK)) for byte in range(256))
+
+
+def encode_piece(piece):
+    if piece is None:
+        return PIECE.pack(NO_PIECE, 0, 0, 0, 0)
+    return PIECE.pack(SHAPE_NAMES.index(piece['shape']), piece['rotation'], piece['x'], piece['y'], piece['color'])
+
+
+def decode_piece(data, offset=0):
+    shape, rotation, x, y, color = PIECE.unpack_from(data, offset)
+    if shape == NO_PIECE:
+        return None
+    return dict(shape=SHAPE_NAMES[shape], rotation=rotation, x=x, y=y, color=color)
+
+
+def encode_board(board, out, offset=0):
+    """
+    Write the BOARD_SIZE bytes of board into out (a bytearray or a writable
+    memoryview) at offset.
+    """
+    codes = CODES
+    for line in board.colors:
+        for x in range(0, BOARD_WIDTH, 2):
+            out[offset] = codes[line[x]] << 4 | codes[line[x + 1]]
+            offset += 1
+
+
+def decode_board(data, offset=0):
+    """
+    Return the BOARD_HEIGHT lines of colors packed in data at offset, ready
+    for Board.load.
+    """
+    pairs = PAIRS
+    lines = []
+    for y in range(BOARD_HEIGHT):
+        line = []
+        for byte in data[offset:offset + ROW_SIZE]:
+            line.extend(pairs[byte])
+        lines.append(line)
+        offset += ROW_SIZE
+    return lines
+
+
+def encode(engine, out=None, offset=0):
+    """
+    Write a SIZE byte snapshot of engine into out at offset and return out,
+    a new bytearray when none is given.
+    """
+    if out is None:
+        out = bytearray(SIZE)
+    flags = engine.moving_left | engine.moving_right << 1 | engine.moving_down << 2 | engine.game_over << 3
+    HEADER.pack_into(out, offset, VERSION, engine.now, engine.score, engine.turn, engine.level, engine.lines,
+                     engine.bonus_lines, engine.bangs, engine.last_move_down_time, engine.last_move_sideways_time, engine.last_fall_time, flags)
+    offset += HEADER.size
+    out[offset:offset + 2 * PIECE.size] = encode_piece(engine.falling_piece) + encode_piece(engine.next_piece)
+    offset += 2 * PIECE.size
+    GARBAGE.pack_into(out, offset, len(engine.garbage), bytes(engine.garbage))
+    encode_board(engine.board, out, offset + GARBAGE.size)
+    return out
+
+
+def decode(data, engine, offset=0):
+    """
+    Restore engine from the snapshot in data and return it. Its match clock
+    and piece reader are left alone, the turn says where the pieces go on.
+    """
+    (version, now, score, turn, level, lines, bonus_lines, bangs,
+     move_down, move_sideways, fall, flags) = HEADER.unpack_from(data, offset)
+    if version != VERSION:
+        raise ValueError('snapshot version %d, expected %d' % (version, VERSION))
+    engine.now, engine.score, engine.turn, engine.bangs = now, score, turn, bangs
+    engine.lines, engine.bonus_lines = lines, bonus_lines
+    engine.update_level()
+    engine.last_move_down_time, engine.last_move_sideways_time, engine.last_fall_time = move_down, move_sideways, fall
+    engine.moving_left, engine.moving_right = bool(flags & 1), bool(flags & 2)
+    engine.moving_down, engine.game_over = bool(flags & 4), bool(flags & 8)
+    offset += HEADER.size
+    engine.falling_piece = decode_piece(data, offset)
+    engine.next_piece = decode_piece(data, offset + PIECE.size)
+    offset += 2 * PIECE.size
+    lines, holes = GARBAGE.unpack_from(data, offset)
+    engine.garbage = list(bytearray(holes[:lines]))
+    engine.board.load(decode_board(data, offset + GARBAGE.size))
+    return engine
+
+
+def state_hash(engine, out=None):
+    """
+    Return a crc32 of the whole snapshot of engine, the same on every
+    machine and Python. out is a SIZE bytearray to encode into, so that
+    hashing every tick allocates nothing.
+    """
+    return zlib.crc32(encode(engine, out)) & 0xffffffff
@@ -0,0 +1,232 @@
+"""
+Lets any number of read-only viewers watch a running match over TCP.
+
+The match publishes the snapshots of every board once a frame. Whatever
+changed since the last publish is encoded once, as the compressed xor of
+the old and new snapshots, and the very same bytes are written to every
+viewer. A viewer joining late gets a keyframe of the whole state first
+and the deltas after it. Writes never block: a viewer whose connection
+cannot keep up is paused by Twisted, skips the deltas it misses and is
+sent a fresh keyframe once it drains, so it holds up neither the game
+loop nor the other viewers.
+"""
+import struct
+import zlib
+from twisted.internet import protocol
+from twisted.internet.interfaces import IPushProducer
+from twisted.protocols.basic import Int16StringReceiver
+from zope.interface import implementer
+from battle import snapshot
+from battle.engine import Engine, MatchClock
+
+PORT = 8125
+KEYFRAME = 1  # sequence, match time, player count and the compressed snapshots of every board
+DELTA = 2  # sequence, match time and the compressed xor of the snapshots with the previous ones
+HEADER = struct.Struct('!BIIB')  # kind, sequence, ms, players
+
+
+def xor(a, b):
+    """
+    Return the bytes of a xor b, both of the same length.
+    """
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+class Broadcast(object):
+    """
+    The encoded state of a match and the viewers watching it.
+    """
+    sequence = 0
+    ms = 0
+
+    def __init__(self, engines=()):
+        self.viewers = set()
+        self.start(engines)
+
+    def start(self, engines):
+        """
+        Follow a new set of engines, e.g. for the next game. Every viewer
+        is sent a keyframe of it.
+        """
+        self.engines = list(engines)
+        self.state = bytearray(snapshot.SIZE * len(self.engines))
+        self.previous = None
+        self.keyframe = None
+        self.publish(self.ms)
+
+    def publish(self, ms):
+        """
+        Encode the engines and send what changed to every viewer. Return
+        the message sent, None when nothing changed.
+
+        @param ms: match time of the state
+        """
+        self.ms = ms
+        view = memoryview(self.state)
+        for i, engine in enumerate(self.engines):
+            snapshot.encode(engine, view, i * snapshot.SIZE)
+        state = bytes(self.state)
+        if state == self.previous:
+            return None
+        self.sequence += 1
+        self.keyframe = None  # made again when someone asks for it
+        if self.previous is None or len(self.previous) != len(state):
+            message = self.keyframe_message()
+        else:
+            message = (HEADER.pack(DELTA, self.sequence, ms, len(self.engines)) +
+                       zlib.compress(xor(state, self.previous)))
+        self.previous = state
+        for viewer in self.viewers:
+            viewer.send(message)
+        return message
+
+    def keyframe_message(self):
+        """
+        Return the keyframe of the current state, made once however many
+        viewers join at it.
+        """
+        if self.keyframe is None:
+            self.keyframe = (HEADER.pack(KEYFRAME, self.sequence, self.ms, len(self.engines)) +
+                             zlib.compress(bytes(self.state)))
+        return self.keyframe
+
+    def join(self, viewer):
+        self.viewers.add(viewer)
+        viewer.send_keyframe()
+
+    def leave(self, viewer):
+        self.viewers.discard(viewer)
+
+
+@implementer(IPushProducer)
+class ViewerProtocol(Int16StringReceiver):
+    """
+    Sending end of one viewer. It registers itself as the producer of its
+    transport, so Twisted pauses it when the viewer's socket buffer fills
+    up instead of queueing deltas without bound.
+    """
+    paused = False
+    stale = False  # deltas were skipped, the viewer needs a keyframe
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+        self.factory.broadcast.join(self)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.factory.broadcast.leave(self)
+
+    def send(self, message):
+        if self.paused:
+            self.stale = True
+        elif self.stale:
+            self.send_keyframe()
+        else:
+            self.sendString(message)
+
+    def send_keyframe(self):
+        if self.paused:
+            self.stale = True
+            return
+        self.stale = False
+        self.sendString(self.factory.broadcast.keyframe_message())
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.stale:
+            self.send_keyframe()
+
+    def stopProducing(self):
+        self.paused = True
+
+    def stringReceived(self, data):
+        pass  # viewers have nothing to say
+
+
+class BroadcastFactory(protocol.ServerFactory):
+    """
+    Listen with it to let viewers watch broadcast:
+
+        reactor.listenTCP(PORT, BroadcastFactory(broadcast))
+    """
+    protocol = ViewerProtocol
+
+    def __init__(self, broadcast):
+        self.broadcast = broadcast
+
+
+class Spectator(object):
+    """
+    Receiving end of a broadcast, keeping one engine per board up to date.
+    Deltas that do not follow the state held are left out until the next
+    keyframe.
+    """
+    sequence = None
+    ms = 0
+
+    def __init__(self, new_engine=None, on_change=None):
+        """
+        @param new_engine: callable taking a board index and returning the
+                           engine to restore it into, headless by default
+        @param on_change: called with the Spectator after every update
+        """
+        self.new_engine = new_engine or (lambda i: Engine(0.0, MatchClock()))
+        self.on_change = on_change
+        self.engines = []
+        self.state = None
+
+    def message_received(self, data):
+        kind, sequence, ms, players = HEADER.unpack_from(data)
+        payload = zlib.decompress(data[HEADER.size:])
+        if kind == KEYFRAME:
+            if len(self.engines) != players:
+                self.engines = [self.new_engine(i) for i in range(players)]
+            self.state = payload
+        elif kind == DELTA and self.sequence is not None and sequence == self.sequence + 1:
+            self.state = xor(self.state, payload)
+        else:
+            return
+        self.sequence = sequence
+        self.ms = ms
+        for i, engine in enumerate(self.engines):
+            snapshot.decode(self.state, engine, i * snapshot.SIZE)
+        if self.on_change is not None:
+            self.on_change(self)
+
+
+class SpectatorProtocol(Int16StringReceiver):
+
+    def connectionMade(self):
+        self.factory.connected(self)
+
+    def stringReceived(self, data):
+        self.factory.spectator.message_received(data)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.factory.disconnected(self)
+
+
+class SpectatorFactory(protocol.ClientFactory):
+    """
+    Connect with it to watch a broadcast, e.g.
+
+        reactor.connectTCP(host, PORT, SpectatorFactory(Spectator()))
+    """
+    protocol = SpectatorProtocol
+    connection = None
+    lost = False
+
+    def __init__(self, spectator):
+        self.spectator = spectator
+
+    def connected(self, connection):
+        self.connection = connection
+
+    def disconnected(self, connection):
+        self.connection = None
+        self.lost = True
+
+    def clientConnectionFailed(self, connector, reason):
+        self.lost = True
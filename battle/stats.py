@@ -0,0 +1,120 @@
+import json
+import time
+from collections import deque
+from battle.configs import FPS
+
+INPUT = 0
+SIMULATION = 1
+RENDER = 2
+PRESENT = 3
+PHASES = ('input', 'simulation', 'render', 'present')
+WINDOW = 10 * FPS  # frames the percentiles are taken over, about ten seconds
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    Return the nearest rank percentiles of values, 0 for each when empty.
+    """
+    if not values:
+        return [0.0] * len(points)
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(len(values) * point / 100.0))] for point in points]
+
+
+class FrameStats(object):
+    """
+    Times the phases of every frame and keeps the last window of them.
+    A frame is begun, then each phase is closed with mark once its work is
+    done (the time since the previous mark goes to it) and the frame is
+    ended with what clock.tick returned. That is two perf_counter calls and
+    a few list operations a frame; the percentiles are only worked out when
+    a summary is asked for. A frame counts as dropped for every whole frame
+    its tick ran over the FPS budget. The summary is appended as a JSON line
+    to path every export_every seconds, if a path is given. Work done off
+    the game loop, like the audio commands, is reported from the window of
+    latencies in audio, if one is given.
+    """
+    start = None
+    last = 0.0
+    last_export = None
+    frames = 0
+    dropped = 0
+    worst = 0.0
+    audio = None  # milliseconds audio commands waited, e.g. Audio.latencies
+
+    def __init__(self, fps=FPS, window=WINDOW, path=None, export_every=10.0, timer=time.perf_counter):
+        """
+        @param fps: the frame rate the game loop ticks at
+        @param window: number of frames the percentiles are taken over
+        @param path: file the summaries are appended to
+        @param export_every: seconds between summaries
+        @param timer: returns seconds, time.perf_counter by default
+        """
+        self.budget = 1000.0 / fps
+        self.path = path
+        self.export_every = export_every
+        self.timer = timer
+        self.phases = [deque(maxlen=window) for _ in PHASES]
+        self.work = deque(maxlen=window)
+        self.ticks = deque(maxlen=window)
+        self.current = [0.0] * len(PHASES)
+
+    def begin(self):
+        self.start = self.last = self.timer()
+        self.current = [0.0] * len(PHASES)
+        if self.last_export is None:
+            self.last_export = self.start
+
+    def mark(self, phase):
+        """
+        Close phase: the time since the last mark or begin was spent on it.
+        """
+        now = self.timer()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, tick=None):
+        """
+        End the frame.
+
+        @param tick: milliseconds clock.tick returned for it
+        """
+        if self.start is None:
+            return
+        work = (self.last - self.start) * 1000
+        for history, seconds in zip(self.phases, self.current):
+            history.append(seconds * 1000)
+        self.work.append(work)
+        self.worst = max(self.worst, work)
+        self.frames += 1
+        if tick is not None:
+            self.ticks.append(tick)
+            self.dropped += max(0, int(tick / self.budget + .5) - 1)
+        self.start = None
+        if self.path is not None and self.last - self.last_export >= self.export_every:
+            self.last_export = self.last
+            self.export()
+
+    @property
+    def fps(self):
+        if not self.ticks:
+            return 0.0
+        return 1000.0 * len(self.ticks) / max(1, sum(self.ticks))
+
+    def summary(self):
+        """
+        Return a dict of the frame and phase percentiles in milliseconds,
+        the worst frame, the dropped frames and the measured frame rate.
+        """
+        summary = dict(time=time.time(), frames=self.frames, dropped=self.dropped, worst=round(self.worst, 3),
+                       fps=round(self.fps, 2), budget=round(self.budget, 3))
+        for name, values in zip(('frame',) + PHASES, (self.work,) + tuple(self.phases)):
+            summary[name] = dict(zip(('p50', 'p95', 'p99'), [round(value, 3) for value in percentiles(values)]))
+        if self.audio is not None:
+            summary['audio'] = dict(zip(('p50', 'p95', 'p99'),
+                                        [round(value, 3) for value in percentiles(list(self.audio))]))
+        return summary
+
+    def export(self):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.summary(), sort_keys=True) + '\n')
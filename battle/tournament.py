@@ -0,0 +1,159 @@
+"""
+Plays lots of seeded bot games on every core to tune the bot and the rules:
+
+    python -m battle.tournament [--games N] [--workers N] [--chunk N] [--json report.json]
+
+Workers are only sent seeds and the configuration, they play the games from
+scratch and send back one small result per game, which is folded into the
+report as chunks come in.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from battle.bot import Search, WEIGHTS
+from battle.engine import Engine, MatchClock, MOVE_LEFT, MOVE_RIGHT, ROTATE, DROP
+from battle.stats import percentiles
+from battle.utils import PieceStream
+
+CHUNK = 50  # games per job, enough to keep the pickling of jobs out of the way
+MAX_PIECES = 1000  # games are cut short after that many pieces
+FIELDS = ('score', 'lines', 'bonus_lines', 'pieces', 'ms')
+CONFIG = dict(weights=WEIGHTS, lookahead=False, max_pieces=MAX_PIECES, rules=dict())
+
+
+def play_game(seed, config=CONFIG, search=None):
+    """
+    Play one game with the bot and return its result. The bot presses all
+    the keys for a piece at once and drops it; no time limit is put on it,
+    so the same seed and configuration always give the same game.
+
+    @param seed: piece seed
+    @param config: dict of weights, lookahead (look at the next piece too),
+                   max_pieces and rules, Engine attributes to override
+                   (e.g. bonus_score)
+    @param search: Search to use, its cache is kept between games
+    """
+    search = search or Search(config['weights'])
+    clock = MatchClock()
+    engine = Engine(0.0, clock, PieceStream(seed).reader())
+    for name, value in config['rules'].items():
+        setattr(engine, name, value)
+    while not engine.game_over and engine.turn <= config['max_pieces']:
+        if engine.falling_piece is None:
+            engine.spawn(engine.now)  # the last piece locked on the final wait
+            continue
+        piece = engine.falling_piece
+        next_shape = engine.next_piece['shape'] if config['lookahead'] else None
+        placement = search.best(tuple(engine.board.rows), piece['shape'], next_shape, poison=engine.board.poison)
+        inputs = []
+        if placement is not None:
+            rotation, x = placement
+            inputs.extend([(ROTATE, True)] * ((rotation - piece['rotation']) % engine.rotations))
+            move = MOVE_RIGHT if x > piece['x'] else MOVE_LEFT
+            inputs.extend([(move, True), (move, False)] * abs(x - piece['x']))
+        inputs.append((DROP, True))
+        clock.ms += 1
+        engine.step(inputs)
+        # Wait out gravity so the piece locks and the next one comes in
+        clock.ms += int(engine.fall_frequency * 1000) + 1
+        engine.step()
+        engine.step()
+        del engine.attacks[:]  # nobody to send garbage to
+    return dict(seed=seed, score=engine.score, lines=engine.lines, bonus_lines=engine.bonus_lines,
+                pieces=engine.turn, ms=clock.ms, game_over=engine.game_over)
+
+
+def play_chunk(seeds, config=CONFIG):
+    """
+    Play a game for every seed with one Search and return the results.
+    """
+    search = Search(config['weights'])
+    return [play_game(seed, config, search) for seed in seeds]
+
+
+class Report(object):
+    """
+    Folds game results into totals and, per field, the mean, min, max and
+    percentiles of every game so far.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.game_overs = 0
+        self.values = dict((field, []) for field in FIELDS)
+
+    def add(self, result):
+        self.games += 1
+        self.game_overs += result['game_over']
+        for field in FIELDS:
+            self.values[field].append(result[field])
+
+    def summary(self):
+        summary = dict(games=self.games, game_overs=self.game_overs)
+        for field, values in self.values.items():
+            if not values:
+                continue
+            p50, p95, p99 = percentiles(values)
+            summary[field] = dict(total=sum(values), mean=round(sum(values) / float(len(values)), 3),
+                                  min=min(values), max=max(values), p50=p50, p95=p95, p99=p99)
+        return summary
+
+
+def run(games, config=CONFIG, first_seed=0, workers=None, chunk=CHUNK, progress=None):
+    """
+    Play games seeded first_seed onwards across a process pool and return
+    the Report. progress(report) is called whenever a chunk comes back.
+
+    @param games: number of games
+    @param config: see play_game
+    @param first_seed:
+    @param workers: processes, one per core by default
+    @param chunk: games per job
+    @param progress:
+    """
+    report = Report()
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(play_chunk, range(start, min(start + chunk, first_seed + games)), config)
+                for start in range(first_seed, first_seed + games, chunk)]
+        for job in as_completed(jobs):
+            for result in job.result():
+                report.add(result)
+            if progress is not None:
+                progress(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m battle.tournament')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--workers', type=int, default=None, help='processes, one per core by default')
+    parser.add_argument('--chunk', type=int, default=CHUNK, help='games per job')
+    parser.add_argument('--lookahead', action='store_true', help='let the bot look at the next piece')
+    parser.add_argument('--max-pieces', type=int, default=MAX_PIECES)
+    parser.add_argument('--bonus-score', type=int, default=None, help='points for a single color line')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args(argv)
+
+    config = dict(CONFIG, lookahead=args.lookahead, max_pieces=args.max_pieces, rules=dict())
+    if args.bonus_score is not None:
+        config['rules']['bonus_score'] = args.bonus_score
+    start = time.time()
+
+    def progress(report):
+        sys.stderr.write('\r%d/%d games' % (report.games, args.games))
+
+    summary = run(args.games, config, args.seed, args.workers, args.chunk, progress).summary()
+    summary['seconds'] = round(time.time() - start, 2)
+    summary['config'] = config
+    sys.stderr.write('\n')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    print(json.dumps(summary, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,10 @@
 from battle.configs import *
 from battle.templates import *
 from battle import COLORS
+from battle.board import Board
+from collections import deque
 import random
 
-pieces = []
-
 
 def convert_pixel_to_coordinates(box_x, box_y, offset=0):
     """
@@ -18,10 +18,7 @@ def get_blank_board():
     """
     Create and return a new blank board data structure.
     """
-    board = []
-    for i in range(BOARD_WIDTH):
-        board.append([BLANK] * BOARD_HEIGHT)
-    return board
+    return Board()
 
 
 def calculate_level_and_fall_frequency(score):
@@ -36,22 +33,120 @@ def calculate_level_and_fall_frequency(score):
     return level, fall_frequency
 
 
-def get_new_piece(turn=None):
+def make_piece(rng=random, poison_rate=0.0):
     """
-    Return a random new piece in a random rotation, color, and location.
+    Return a random new piece in a random rotation, color, and location
+    drawn from rng (a random.Random, the random module by default). It is
+    a poison piece with a chance of poison_rate.
     """
-    if turn is not None and turn < len(pieces):
-        return pieces[turn].copy()
-    shape = random.choice(list(SHAPES.keys()))
-    new_piece = {
+    shapes = POISONS if poison_rate and rng.random() < poison_rate else SHAPES
+    shape = rng.choice(list(shapes.keys()))
+    return {
         'shape': shape,
-        'rotation': random.randint(0, len(SHAPES[shape]) - 1),
-        'x': random.randint(0, BOARD_WIDTH - TEMPLATE_WIDTH),
+        'rotation': rng.randint(0, len(shapes[shape]) - 1),
+        'x': rng.randint(0, BOARD_WIDTH - TEMPLATE_WIDTH),
         'y': -2,  # start it above the board (i.e. less than 0)
-        'color': random.randint(0, len(COLORS) - 1)
+        'color': rng.randint(0, len(COLORS) - 1)
     }
-    pieces.append(new_piece)
-    return new_piece.copy()
+
+
+class PieceStream(object):
+    """
+    Seeded supply of the pieces of one match. Every player reads it through
+    its own reader(), a get_piece(turn) callable, and gets the same pieces
+    for the same turns. Make it with one reader slot per player so no piece
+    is dropped before the last player starts. Pieces are made on demand and
+    dropped once every reader still playing has moved past them, however far
+    behind the slowest one is; a reader that stops (e.g. game over) gives up
+    its slot with get_piece.release() so it holds nothing back. A share
+    poison_rate of the pieces are poison ones.
+    """
+    seed = None
+    end = 0  # turn of the next piece to be made
+    claimed = 0  # reader slots handed out
+
+    def __init__(self, seed=None, readers=1, poison_rate=POISON_RATE):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.poison_rate = poison_rate
+        self.rng = random.Random(seed)
+        self.window = deque()
+        self.positions = [0] * readers  # turn every reader is at, None once released
+
+    @property
+    def first(self):
+        """
+        Turn of the oldest piece still held.
+        """
+        return self.end - len(self.window)
+
+    def reader(self, index=None):
+        """
+        Return a get_piece(turn) callable for one player. Pass the index
+        of an existing reader to read on from where it is, e.g. on a fork.
+        get_piece.release() gives the slot up once the player is done.
+
+        @param index:
+        """
+        if index is None:
+            index = self.claimed
+            self.claimed += 1
+            if index >= len(self.positions):
+                self.positions.append(self.first)
+
+        def get_piece(turn):
+            return self.get(index, turn)
+        get_piece.release = lambda: self.release(index)
+        return get_piece
+
+    def get(self, index, turn):
+        """
+        Return a copy of the piece for turn and note that reader index is
+        done with every piece before it.
+        """
+        if turn < self.first:
+            raise IndexError('piece %s has already been dropped' % turn)
+        while self.end <= turn:
+            self.window.append(make_piece(self.rng, self.poison_rate))
+            self.end += 1
+        piece = self.window[turn - self.first].copy()
+        self.positions[index] = turn
+        self.forget()
+        return piece
+
+    def release(self, index):
+        """
+        Note that reader index will not ask for any more pieces. Reading
+        again takes the slot back from the turn read.
+        """
+        self.positions[index] = None
+        self.forget()
+
+    def forget(self):
+        """
+        Drop the pieces every reader still playing is done with.
+        """
+        live = [position for position in self.positions if position is not None]
+        oldest = min(live) if live else self.end
+        while self.first < oldest:
+            self.window.popleft()
+
+    def fork(self):
+        """
+        Return an independent copy of the stream that makes the same pieces
+        from here on, with the same readers.
+        """
+        other = PieceStream.__new__(PieceStream)
+        other.seed = self.seed
+        other.poison_rate = self.poison_rate
+        other.rng = random.Random()
+        other.rng.setstate(self.rng.getstate())
+        other.window = deque(self.window)  # pieces are only handed out as copies
+        other.end = self.end
+        other.claimed = self.claimed
+        other.positions = list(self.positions)
+        return other
 
 
 def is_on_board(x, y):
@@ -62,13 +157,4 @@ def is_valid_position(board, piece, adj_x=0, adj_y=0):
     """
     Return True if the piece is within the board and not colliding.
     """
-    for x in range(TEMPLATE_WIDTH):
-        for y in range(TEMPLATE_HEIGHT):
-            is_above_board = y + piece['y'] + adj_y < 0
-            if is_above_board or SHAPES[piece['shape']][piece['rotation']][x][y] in (BLANK, POISON):
-                continue
-            if not is_on_board(x + piece['x'] + adj_x, y + piece['y'] + adj_y):
-                return False
-            if board[x + piece['x'] + adj_x][y + piece['y'] + adj_y] != BLANK:
-                return False
-    return True
+    return board.is_valid_position(piece, adj_x, adj_y)
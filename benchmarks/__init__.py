@@ -0,0 +1,357 @@
+import gc
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+# Run the renderer on an offscreen surface, no window or sound card needed.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from pygame.locals import KEYDOWN, K_SPACE
+from battle.board import FULL_ROW
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, BLANK, FPS
+from battle.engine import MatchClock
+from battle.player import Player
+from battle import snapshot
+from battle.utils import Board, PieceStream, make_piece
+
+BENCHMARKS = OrderedDict()
+MIN_TIME = .2  # seconds a timed window takes at least, short ones are mostly noise
+REPEAT = 7
+CALIBRATION = 'calibration'  # times the machine rather than the game, the others are scaled by it
+
+
+def benchmark(name, max_number=None):
+    """
+    Register a benchmark. It is called with a number of operations to run
+    and returns the seconds they took, leaving out its own setup. Slow ones
+    set max_number to cap the operations they are asked for.
+    """
+    def register(func):
+        func.max_number = max_number
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def timed(func, number):
+    """
+    Return the seconds func took for number operations, with the garbage
+    collector off so a collection does not land in one window only.
+    """
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func(number)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def autorange(func, min_time=MIN_TIME):
+    """
+    Return the number of operations, 1, 2, 5, 10, 20, 50... that func takes
+    at least min_time seconds for, like timeit.Timer.autorange, or its
+    max_number if it gets there first.
+    """
+    scale = 1
+    while True:
+        for step in (1, 2, 5):
+            number = step * scale
+            if func.max_number and number >= func.max_number:
+                return func.max_number
+            if timed(func, number) >= min_time:
+                return number
+        scale *= 10
+
+
+def run(names, number=None, repeat=REPEAT):
+    """
+    Return {name: best time per operation in nanoseconds} for the
+    benchmarks names, over repeat windows of number operations each, by
+    default enough of them to take MIN_TIME seconds. The windows go round
+    the benchmarks in turn, so a burst of load on the machine only spoils
+    one window of each rather than every window of one.
+    """
+    numbers = OrderedDict()
+    for name in names:
+        func = BENCHMARKS[name]
+        count = number or autorange(func)
+        numbers[name] = min(count, func.max_number or count)
+    best = dict()
+    for _ in range(repeat):
+        for name, count in numbers.items():
+            spent = timed(BENCHMARKS[name], count) / count * 1e9
+            best[name] = min(best.get(name, spent), spent)
+    return OrderedDict((name, best[name]) for name in names)
+
+
+def half_full_board(seed=0):
+    """
+    Return a board with its bottom half randomly filled.
+    """
+    rng = random.Random(seed)
+    board = Board()
+    for y in range(BOARD_HEIGHT // 2, BOARD_HEIGHT):
+        colors = [rng.randrange(4) if rng.random() < .7 else BLANK for _ in range(BOARD_WIDTH)]
+        colors[rng.randrange(BOARD_WIDTH)] = BLANK
+        board.set_row(y, sum(1 << x for x, color in enumerate(colors) if color != BLANK), colors)
+    return board
+
+
+def worst_case_board():
+    """
+    Return a board with four complete single color lines at the bottom
+    and a stack up to the top above them: the most a lock can clear under
+    the most lines that have to be pulled down.
+    """
+    board = Board()
+    for y in range(2, BOARD_HEIGHT):
+        if y >= BOARD_HEIGHT - 4:
+            board.set_row(y, FULL_ROW, [y % 4] * BOARD_WIDTH)
+        else:
+            colors = [y % 4] * BOARD_WIDTH
+            colors[y % BOARD_WIDTH] = BLANK
+            board.set_row(y, FULL_ROW & ~(1 << (y % BOARD_WIDTH)), colors)
+    return board
+
+
+def new_player():
+    return Player(0.0, 0, True, clock=MatchClock(), get_piece=PieceStream(0).reader())
+
+
+@benchmark(CALIBRATION)
+def bench_calibration(number):
+    """
+    A fixed bit of plain Python that no change to the game touches, it
+    tells how fast the machine runs at the moment.
+    """
+    rows = list(range(BOARD_HEIGHT))
+    start = time.perf_counter()
+    for _ in range(number):
+        total = 0
+        for y in rows:
+            total += (y * 31 ^ total) & 0xffff
+    return time.perf_counter() - start
+
+
+@benchmark('is_valid_position')
+def bench_is_valid_position(number):
+    rng = random.Random(0)
+    board = half_full_board()
+    pieces = [make_piece(rng) for _ in range(number)]
+    for piece in pieces:
+        piece['y'] = rng.randrange(-2, BOARD_HEIGHT - 2)
+    start = time.perf_counter()
+    for piece in pieces:
+        board.is_valid_position(piece, 0, 1)
+    return time.perf_counter() - start
+
+
+@benchmark('add_to_board')
+def bench_add_to_board(number):
+    rng = random.Random(0)
+    player = new_player()
+    boards = [Board() for _ in range(number)]
+    pieces = [make_piece(rng) for _ in range(number)]
+    for piece in pieces:
+        piece['y'] = BOARD_HEIGHT - 5
+    start = time.perf_counter()
+    for board, piece in zip(boards, pieces):
+        player.board = board
+        player.add_to_board(piece)
+    return time.perf_counter() - start
+
+
+@benchmark('remove_completed_line')
+def bench_remove_completed_line(number):
+    player = new_player()
+    boards = [worst_case_board() for _ in range(number)]
+    start = time.perf_counter()
+    for board in boards:
+        player.board = board
+        player.remove_completed_line()
+    return time.perf_counter() - start
+
+
+@benchmark('add_garbage')
+def bench_add_garbage(number):
+    boards = [half_full_board(seed) for seed in range(number)]
+    start = time.perf_counter()
+    for board in boards:
+        board.add_garbage(4, 3)
+    return time.perf_counter() - start
+
+
+@benchmark('calculate_moves')
+def bench_calculate_moves(number):
+    player = new_player()
+    player.moving_left = True
+    now = 0.0
+    start = time.perf_counter()
+    for _ in range(number):
+        now += .3  # late enough for a sideways move and a fall every time
+        if player.falling_piece is None and player.spawn(now):
+            player.board = Board()
+            player.game_over = False
+            player.spawn(now)
+        player.calculate_moves(now)
+    return time.perf_counter() - start
+
+
+@benchmark('hard_drop')
+def bench_hard_drop(number):
+    player = new_player()
+    player.board = half_full_board()
+    piece = player.falling_piece
+    start = time.perf_counter()
+    for _ in range(number):
+        piece['y'] = -2
+        player.handle_event(KEYDOWN, K_SPACE)
+    return time.perf_counter() - start
+
+
+@benchmark('snapshot_encode')
+def bench_snapshot_encode(number):
+    player = new_player()
+    player.board = half_full_board()
+    out = bytearray(snapshot.SIZE)
+    start = time.perf_counter()
+    for _ in range(number):
+        snapshot.state_hash(player, out)
+    return time.perf_counter() - start
+
+
+@benchmark('snapshot_decode')
+def bench_snapshot_decode(number):
+    player = new_player()
+    player.board = half_full_board()
+    data = snapshot.encode(player)
+    start = time.perf_counter()
+    for _ in range(number):
+        snapshot.decode(data, player)
+    return time.perf_counter() - start
+
+
+# Modules worker processes and command line tools start with; none of them
+# may pull pygame in and together they must load within COLD_START_BUDGET.
+CORE_MODULES = ('battle.engine', 'battle.board', 'battle.snapshot', 'battle.replay', 'battle.bot')
+COLD_START_BUDGET = .1  # seconds, interpreter start included
+COLD_START = """
+import sys
+import %s
+assert 'pygame' not in sys.modules, 'pygame imported by the core'
+""" % ', '.join(CORE_MODULES)
+
+
+@benchmark('cold_start', max_number=10)
+def bench_cold_start(number):
+    start = time.perf_counter()
+    for _ in range(number):
+        subprocess.check_call([sys.executable, '-c', COLD_START])
+    spent = time.perf_counter() - start
+    if spent / number > COLD_START_BUDGET:
+        raise AssertionError('cold start took %.1f ms, over the %.1f ms budget'
+                             % (spent / number * 1000, COLD_START_BUDGET * 1000))
+    return spent
+
+
+def new_game():
+    """
+    Return a BattleTetro with a two player game set up like run_game does.
+    """
+    import battle
+    game = battle.BattleTetro(sound=False)  # an audio thread would run in the timings
+    game.now = time.time()
+    pieces = PieceStream(0, readers=2)
+    clock = MatchClock()
+    game.players = list()
+    for i in range(2):
+        player = Player(0.0, i, False, clock=clock, get_piece=pieces.reader())
+        player.border_color = battle.BORDER_COLOR[i]
+        game.players.append(player)
+    game.setup_renderers()
+    game.setup_input()
+    return game, clock
+
+
+@benchmark('draw_board_lock')
+def bench_draw_board_lock(number):
+    """
+    Draw a frame after a lock: the board changed, so every box is compared
+    and the ones that differ repainted.
+    """
+    from battle.render import BoardRenderer
+    game, _ = new_game()
+    boards = [half_full_board(0), half_full_board(1)]
+    boards[1].version += 1  # both took as many changes, tell them apart
+    piece = new_player().falling_piece
+    renderer = BoardRenderer(0, game.players[0].border_color, game.atlas)
+    start = time.perf_counter()
+    for i in range(number):
+        renderer.draw(game.surface, boards[i % 2], piece)
+    return time.perf_counter() - start
+
+
+@benchmark('draw_board_move')
+def bench_draw_board_move(number):
+    """
+    Draw a frame where only the falling piece moved.
+    """
+    from battle.render import BoardRenderer
+    game, _ = new_game()
+    board = half_full_board()
+    piece = new_player().falling_piece
+    renderer = BoardRenderer(0, game.players[0].border_color, game.atlas)
+    renderer.draw(game.surface, board, piece)
+    start = time.perf_counter()
+    for i in range(number):
+        piece['x'] = 3 + i % 3
+        renderer.draw(game.surface, board, piece)
+    return time.perf_counter() - start
+
+
+def bench_draw_grid(count, number):
+    """
+    Draw a frame of count boards whose pieces all moved since the last.
+    """
+    from battle.render import GridView
+    game, clock = new_game()
+    players = [new_player() for _ in range(count)]
+    for i, player in enumerate(players):
+        player.board = half_full_board(i)
+    grid = GridView(count, pygame.Rect(0, 0, 500, 480), game.atlas)
+    start = time.perf_counter()
+    for i in range(number):
+        for player in players:
+            player.falling_piece['x'] = 3 + i % 3
+        grid.draw(game.surface, players)
+    return time.perf_counter() - start
+
+
+@benchmark('draw_grid_4')
+def bench_draw_grid_4(number):
+    return bench_draw_grid(4, number)
+
+
+@benchmark('draw_grid_64', max_number=100)
+def bench_draw_grid_64(number):
+    return bench_draw_grid(64, number)
+
+
+@benchmark('frame')
+def bench_frame(number):
+    game, clock = new_game()
+    start = time.perf_counter()
+    for _ in range(number):
+        game.now -= 1.0 / FPS  # a frame's worth of play to step every time
+        game.stats.begin()
+        if not game.frame(clock):
+            game, clock = new_game()
+        game.stats.end()
+    return time.perf_counter() - start
@@ -0,0 +1,108 @@
+"""
+Run the benchmarks and compare them with the stored baseline:
+
+    python -m benchmarks [-k name] [--json results.json] [--update-baseline]
+
+Exits with 1 when a benchmark got slower than its baseline by more than
+the threshold stored with it. Each benchmark is timed over windows of at
+least MIN_TIME seconds with the garbage collector off. The windows go
+round all the benchmarks REPEAT times and the best of each counts. The
+baseline is scaled by how fast the calibration benchmark, plain Python
+that does not change, runs against its own baseline, so a machine that
+is busier or slower than when the baseline was stored trips nothing. A
+benchmark over the threshold is timed again, up to RECHECKS times, and
+only counts as a regression if it stays over: a real slowdown does, a
+burst of load on the machine does not.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from benchmarks import BENCHMARKS, CALIBRATION, MIN_TIME, REPEAT, run
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+THRESHOLD = .25  # slowdown allowed before a benchmark counts as a regression
+RECHECKS = 2  # times a benchmark over the threshold is timed again before it counts as a regression
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return dict(threshold=THRESHOLD, results=dict())
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(measured, baseline):
+    """
+    Return {name: time against the baseline} for the benchmarks measured
+    that have one, the baseline scaled by how much slower the calibration
+    benchmark ran than its own.
+    """
+    results = baseline['results']
+    speed = 1.0
+    if CALIBRATION in measured and CALIBRATION in results:
+        speed = measured[CALIBRATION] / results[CALIBRATION]
+    return dict((name, ns / (results[name] * speed)) for name, ns in measured.items()
+                if name in results and name != CALIBRATION)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', dest='only', action='append', help='only run benchmarks with this in their name')
+    parser.add_argument('-n', dest='number', type=int, default=None,
+                        help='operations per repeat, by default enough for %s seconds' % MIN_TIME)
+    parser.add_argument('-r', dest='repeat', type=int, default=REPEAT, help='repeats, the best one counts')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the baseline')
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    threshold = baseline.get('threshold', THRESHOLD)
+    results = dict()
+    regressions = list()
+    names = [name for name in BENCHMARKS
+             if name == CALIBRATION or not args.only or any(part in name for part in args.only)]
+    measured = run(names, args.number, args.repeat)
+    ratios = compare(measured, baseline)
+    for _ in range(RECHECKS):
+        slow = [name for name, ratio in ratios.items() if ratio > 1 + threshold]
+        if not slow:
+            break
+        again = run([CALIBRATION] + slow, args.number, args.repeat)
+        for name, ratio in compare(again, baseline).items():
+            if ratio < ratios[name]:
+                ratios[name] = ratio
+                measured[name] = again[name]
+
+    for name, ns in measured.items():
+        results[name] = round(ns, 1)
+        line = '%-24s %12.1f ns/op' % (name, ns)
+        if name == CALIBRATION and name in baseline['results']:
+            line += '  machine x%.2f' % (ns / baseline['results'][name])
+        elif name in ratios:
+            line += '  %+6.1f%%' % ((ratios[name] - 1) * 100)
+            if ratios[name] > 1 + threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    report = dict(python=platform.python_version(), machine=platform.machine(), threshold=threshold,
+                  results=results, regressions=regressions)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        baseline['threshold'] = threshold
+        baseline['python'] = report['python']
+        baseline['machine'] = report['machine']
+        baseline['results'].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import random
+import unittest
+import numpy
+from battle.batch import BatchSimulator, SHAPE_NAMES, ROTATIONS, POISON_BOX
+from battle.configs import BOARD_WIDTH, BOARD_HEIGHT, BLANK, POISON
+from battle.engine import Engine, DROP
+
+GAMES = 300
+
+
+def random_line(rng):
+    """
+    Return the colors of a line: blank, partly filled, or full of one color,
+    of mixed colors or with poison in it.
+    """
+    kind = rng.randrange(6)
+    if kind == 0:
+        return [BLANK] * BOARD_WIDTH
+    if kind == 1:
+        return [rng.randrange(4)] * BOARD_WIDTH
+    line = [rng.randrange(2) for _ in range(BOARD_WIDTH)]
+    if kind == 2:
+        line[rng.randrange(BOARD_WIDTH)] = POISON
+    elif kind >= 4:
+        for x in rng.sample(range(BOARD_WIDTH), rng.randint(1, 4)):
+            line[x] = BLANK
+        if kind == 5:
+            line[rng.randrange(BOARD_WIDTH)] = POISON
+    return line
+
+
+def box(color):
+    return 0 if color == BLANK else POISON_BOX if color == POISON else color + 1
+
+
+def random_games(rng, sim):
+    """
+    Fill the boards of sim with random stacks and return engines holding
+    the same boards.
+    """
+    engines = []
+    for i in range(sim.n):
+        height = rng.randint(0, BOARD_HEIGHT - 4)
+        colors = [[BLANK] * BOARD_WIDTH for _ in range(BOARD_HEIGHT - height)]
+        colors.extend(random_line(rng) for _ in range(height))
+        engine = Engine(0.0)
+        engine.board.load(colors)
+        sim.boards[i] = [[box(color) for color in line] for line in colors]
+        engines.append(engine)
+    return engines
+
+
+def falling_piece(sim, i):
+    """
+    Return the falling piece of game i of sim as an Engine piece.
+    """
+    piece = dict((key, int(values[i])) for key, values in sim.piece.items())
+    piece['shape'] = SHAPE_NAMES[piece['shape']]
+    return piece
+
+
+class BatchParityTest(unittest.TestCase):
+    """
+    BatchSimulator has to play exactly like Board and Engine.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(5)
+        self.sim = BatchSimulator(GAMES, seed=5, poison_rate=.3)
+        self.engines = random_games(self.rng, self.sim)
+
+    def test_is_valid_position(self):
+        sim = self.sim
+        for _ in range(20):
+            sim.piece['shape'][:] = [self.rng.randrange(len(SHAPE_NAMES)) for _ in range(GAMES)]
+            sim.piece['rotation'][:] = [self.rng.randrange(ROTATIONS[shape]) for shape in sim.piece['shape']]
+            sim.piece['x'][:] = [self.rng.randint(-3, BOARD_WIDTH - 1) for _ in range(GAMES)]
+            sim.piece['y'][:] = [self.rng.randint(-4, BOARD_HEIGHT - 1) for _ in range(GAMES)]
+            for adj_x, adj_y in ((0, 0), (-1, 0), (1, 0), (0, 1)):
+                valid = sim.is_valid_position(adj_x, adj_y)
+                for i, engine in enumerate(self.engines):
+                    self.assertEqual(bool(valid[i]), engine.board.is_valid_position(falling_piece(sim, i), adj_x, adj_y))
+
+    def test_drop_lock_and_clear(self):
+        """
+        Hard dropping the same pieces ends in the same boards, lines and
+        scores.
+        """
+        sim = self.sim
+        for _ in range(3):
+            sim.piece['y'][:] = -2
+            sim.apply_actions(numpy.full(GAMES, DROP))
+            every = numpy.ones(GAMES, dtype=bool)
+            for i, engine in enumerate(self.engines):
+                engine.falling_piece = falling_piece(sim, i)
+                engine.falling_piece['y'] = -2
+                engine.apply_action(DROP)
+                self.assertEqual(engine.falling_piece['y'], sim.piece['y'][i])
+                engine.board.add_piece(engine.falling_piece)
+                engine.remove_completed_line()
+            sim.lock(every)
+            sim.remove_completed_lines(every)
+            sim.spawn(every)
+            for i, engine in enumerate(self.engines):
+                self.assertEqual(sim.boards[i].tolist(), [[box(color) for color in line] for line in engine.board.colors])
+                self.assertEqual((engine.lines, engine.bonus_lines, engine.score),
+                                 (sim.lines[i], sim.bonus_lines[i], sim.score[i]))
+        self.assertGreater(sim.lines.sum(), 0)
+        self.assertGreater(sim.bonus_lines.sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import random
+import unittest
+from twisted.internet import reactor
+from battle.configs import POISON
+from battle.network import HeadlessPeer, Match, MatchFactory, checksum
+
+STEPS = 300
+
+
+def random_policy(seed):
+    rng = random.Random(seed)
+    return lambda engine: [(rng.randrange(6), rng.random() < .7)] if rng.random() < .3 else []
+
+
+class LoopbackMatchTest(unittest.TestCase):
+    """
+    Two headless peers play a match over loopback. Each replica has to
+    follow the other peer's board from the inputs alone.
+    """
+
+    def test_replicas_match(self):
+        peers = [HeadlessPeer(random_policy(1), fps=500), HeadlessPeer(random_policy(2), fps=500)]
+        matches = [None, None]
+
+        def started(i):
+            def start(match):
+                matches[i] = match
+                peers[i].start(match)
+            return start
+
+        port = reactor.listenTCP(0, MatchFactory(True, seed=42, on_start=started(0)), interface='127.0.0.1')
+        connector = reactor.connectTCP('127.0.0.1', port.getHost().port, MatchFactory(False, on_start=started(1)))
+        try:
+            for _ in range(100000):
+                if all(match is not None and (match.steps >= STEPS or match.local.game_over) for match in matches):
+                    break
+                reactor.iterate(.001)
+            for peer in peers:
+                peer.stop()
+            for _ in range(50):  # let the last steps arrive
+                reactor.iterate(.001)
+        finally:
+            connector.disconnect()
+            port.stopListening()
+            for _ in range(10):
+                reactor.iterate(.001)
+
+        host, guest = matches
+        self.assertEqual(host.corrections, 0)
+        self.assertEqual(guest.corrections, 0)
+        self.assertEqual(checksum(host.local), checksum(guest.remote))
+        self.assertEqual(checksum(guest.local), checksum(host.remote))
+
+
+class CorrectionTest(unittest.TestCase):
+    """
+    A replica that went wrong is brought back in line by the next checksum.
+    """
+
+    def test_corrupted_replica_is_corrected(self):
+        host = guest = None
+        host = Match(7, lambda data: guest.message_received(data))
+        guest = Match(7, lambda data: host.message_received(data))
+        policies = [random_policy(1), random_policy(2)]
+        for step in range(1, 600):
+            for match, policy in zip((host, guest), policies):
+                match.tick(step * 10, policy(match.local))
+            if step == 100:
+                replica = guest.remote
+                colors = [list(line) for line in replica.board.colors]
+                colors[-1][3] = POISON
+                colors[-5] = [1] * len(colors[-5])
+                replica.board.load(colors)
+                replica.score += 7
+                replica.garbage.append(4)
+        self.assertEqual(host.corrections, 0)
+        self.assertEqual(guest.corrections, 1)
+        self.assertEqual(checksum(host.local), checksum(guest.remote))
+        self.assertEqual(checksum(guest.local), checksum(host.remote))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from battle.utils import PieceStream
+
+
+def read(get_piece, first, count):
+    return [get_piece(turn) for turn in range(first, first + count)]
+
+
+class PieceStreamTest(unittest.TestCase):
+
+    def test_same_seed_makes_same_pieces(self):
+        pieces = read(PieceStream(7).reader(), 0, 50)
+        self.assertEqual(pieces, read(PieceStream(7).reader(), 0, 50))
+        self.assertNotEqual(pieces, read(PieceStream(8).reader(), 0, 50))
+
+    def test_readers_get_same_pieces(self):
+        stream = PieceStream(7, readers=2)
+        first, second = stream.reader(), stream.reader()
+        self.assertEqual(read(first, 0, 30), read(second, 0, 30))
+
+    def test_pieces_are_copies(self):
+        get_piece = PieceStream(7).reader()
+        get_piece(0)['y'] = 10
+        self.assertEqual(get_piece(0)['y'], -2)
+
+    def test_slow_reader_keeps_its_pieces(self):
+        """
+        However far ahead one reader gets, the pieces the other has not
+        read yet are kept, and nothing before the slowest reader is.
+        """
+        stream = PieceStream(7, readers=2)
+        fast, slow = stream.reader(), stream.reader()
+        expected = read(PieceStream(7).reader(), 0, 500)
+        self.assertEqual(read(fast, 0, 500), expected)
+        self.assertEqual(len(stream.window), 500)
+        self.assertEqual(read(slow, 0, 100), expected[:100])
+        self.assertEqual(stream.first, 99)
+        self.assertRaises(IndexError, slow, 98)
+        self.assertEqual(read(slow, 99, 401), expected[99:])
+
+    def test_release(self):
+        """
+        A released reader holds no pieces back, one still playing does.
+        """
+        stream = PieceStream(7, readers=3)
+        done, playing, fast = stream.reader(), stream.reader(), stream.reader()
+        done(0)
+        playing(5)
+        read(fast, 0, 20)
+        self.assertEqual(stream.first, 0)
+        done.release()
+        self.assertEqual(stream.first, 5)
+        playing.release()
+        self.assertEqual(stream.first, 19)
+        fast.release()
+        self.assertEqual(len(stream.window), 0)
+
+    def test_fork_is_independent(self):
+        """
+        A fork makes the same pieces from where the stream was, and reading
+        either one leaves the other alone.
+        """
+        stream = PieceStream(7, readers=2)
+        reader = stream.reader()
+        read(reader, 0, 10)
+        other = stream.fork()
+        expected = read(PieceStream(7).reader(), 0, 40)
+        forked = other.reader(0)
+        self.assertEqual(read(forked, 9, 31), expected[9:])
+        self.assertEqual((stream.first, stream.end), (0, 10))
+        self.assertEqual(read(reader, 9, 31), expected[9:])
+        self.assertEqual(other.positions, [39, 0])
+        self.assertEqual(stream.positions, [39, 0])
+        forked.release()
+        self.assertEqual(stream.positions, [39, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
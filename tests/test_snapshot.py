@@ -0,0 +1,67 @@
+import unittest
+from battle import snapshot
+from battle.configs import BOARD_WIDTH, BLANK, POISON
+from battle.engine import Engine, MatchClock, DROP
+from battle.utils import PieceStream
+
+
+def played_engine():
+    """
+    Return an engine some pieces into a game, with poison on its board,
+    garbage on its way in and a key held down.
+    """
+    clock = MatchClock()
+    engine = Engine(0.0, clock, PieceStream(11).reader())
+    for ms in range(10, 3000, 10):
+        clock.ms = ms
+        engine.step([(DROP, True)] if ms % 50 == 0 else [])
+    colors = [list(line) for line in engine.board.colors]
+    colors[-1] = [POISON, 0, 1, 2, 3] + [BLANK] * (BOARD_WIDTH - 5)
+    colors[-2] = [POISON] * BOARD_WIDTH
+    engine.board.load(colors)
+    engine.receive_garbage(2, 3)
+    engine.receive_garbage(1, 7)
+    engine.moving_left = True
+    return engine
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def assertSameState(self, engine, other):
+        self.assertEqual(list(other.board.colors), list(engine.board.colors))
+        self.assertEqual(list(other.board.rows), list(engine.board.rows))
+        self.assertEqual(other.board.poison, engine.board.poison)
+        for name in ('now', 'score', 'turn', 'level', 'lines', 'bonus_lines', 'bangs', 'garbage',
+                     'falling_piece', 'next_piece', 'moving_left', 'moving_right', 'moving_down', 'game_over',
+                     'last_move_down_time', 'last_move_sideways_time', 'last_fall_time'):
+            self.assertEqual(getattr(other, name), getattr(engine, name), name)
+
+    def test_round_trip(self):
+        engine = played_engine()
+        data = snapshot.encode(engine)
+        self.assertEqual(len(data), snapshot.SIZE)
+        other = snapshot.decode(data, Engine(0.0))
+        self.assertSameState(engine, other)
+        self.assertEqual(snapshot.encode(other), data)
+        self.assertEqual(snapshot.state_hash(other), snapshot.state_hash(engine))
+
+    def test_round_trip_at_offset(self):
+        """
+        Snapshots packed one after the other in a buffer, written and read
+        through a memoryview.
+        """
+        engines = [played_engine(), Engine(0.0)]
+        view = memoryview(bytearray(3 + 2 * snapshot.SIZE))
+        for i, engine in enumerate(engines):
+            snapshot.encode(engine, view, 3 + i * snapshot.SIZE)
+        for i, engine in enumerate(engines):
+            self.assertSameState(engine, snapshot.decode(view, Engine(0.0), 3 + i * snapshot.SIZE))
+
+    def test_wrong_version(self):
+        data = snapshot.encode(Engine(0.0))
+        data[0] = snapshot.VERSION + 1
+        self.assertRaises(ValueError, snapshot.decode, data, Engine(0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()